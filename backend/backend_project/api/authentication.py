@@ -0,0 +1,149 @@
+import copy
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+TOKEN_CACHE_KEY = 'auth:token:{digest}'
+TOKEN_GENERATION_KEY = 'auth:token-generation:{digest}'
+
+
+class LocalTokenCache:
+    """
+    LRU-кэш токенов в памяти процесса с ограниченным временем жизни.
+    Каждый запрос получает свою копию пользователя и токена: изменения
+    объектов в одном запросе не видны другим.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def set(self, key, value):
+        value = copy.deepcopy(value)
+        with self.lock:
+            self.entries[key] = (
+                time.monotonic() + settings.AUTH_TOKEN_LOCAL_TTL, value
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.AUTH_TOKEN_LOCAL_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+local_cache = LocalTokenCache()
+
+
+def shared_cache_saves_query():
+    """
+    Общий кэш в БД не экономит запрос: обращение к нему стоит столько же,
+    сколько поиск токена. Тогда токены кэшируются только в процессе.
+    """
+    return not settings.CACHES['default']['BACKEND'].endswith(
+        'DatabaseCache'
+    )
+
+
+def get_cache_keys(key):
+    # В общем кэше хранится не сам токен, а его хэш.
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return (
+        TOKEN_CACHE_KEY.format(digest=digest),
+        TOKEN_GENERATION_KEY.format(digest=digest)
+    )
+
+
+def get_generation(generation_key):
+    """
+    Поколение записей токена в общем кэше. Отсутствующее (новое или
+    вытесненное) заводится заново: записи, сделанные до этого, ему уже
+    не соответствуют.
+    """
+    generation = cache.get(generation_key)
+    if generation is None:
+        cache.add(generation_key, uuid.uuid4().hex, None)
+        generation = cache.get(generation_key)
+    return generation
+
+
+def invalidate_token(key):
+    """
+    Сброс записи после фиксации транзакции: до нее параллельный запрос
+    прочитал бы из БД старые данные и снова положил их в кэш. Запрос,
+    прочитавший БД до фиксации, может положить их и после сброса, поэтому
+    меняется и поколение токена: такая запись ему не соответствует.
+    """
+    cache_key, generation_key = get_cache_keys(key)
+
+    def delete():
+        cache.set(generation_key, uuid.uuid4().hex, None)
+        cache.delete(cache_key)
+        local_cache.delete(cache_key)
+
+    transaction.on_commit(delete)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену без запроса к БД на каждый вызов API.
+
+    Пара (пользователь, токен) ищется в LRU-кэше процесса, затем в общем
+    кэше, если он не в БД, и только потом в БД. Запись общего кэша
+    действительна, пока не сменилось поколение токена. Записи сбрасываются
+    сигналами при удалении токена (в том числе при выходе через djoser) и
+    при смене пароля или активности пользователя. Остальные процессы
+    увидят изменение не позже чем через AUTH_TOKEN_LOCAL_TTL секунд.
+    """
+
+    def get_shared(self, cache_key, generation_key):
+        """Пара из общего кэша и текущее поколение токена."""
+        entries = cache.get_many([cache_key, generation_key])
+        generation = entries.get(generation_key)
+        if generation is None:
+            return None, get_generation(generation_key)
+        entry = entries.get(cache_key)
+        if entry is None or entry[0] != generation:
+            return None, generation
+        return entry[1], generation
+
+    def authenticate_credentials(self, key):
+        cache_key, generation_key = get_cache_keys(key)
+        credentials = local_cache.get(cache_key)
+        if credentials is not None:
+            return credentials
+        shared = shared_cache_saves_query()
+        if shared:
+            # Поколение читается до БД: сброс после чтения его сменит
+            credentials, generation = self.get_shared(
+                cache_key, generation_key
+            )
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            if shared:
+                cache.set(
+                    cache_key, (generation, credentials),
+                    settings.AUTH_TOKEN_CACHE_TTL
+                )
+        local_cache.set(cache_key, credentials)
+        return credentials
@@ -0,0 +1,83 @@
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .replicas import primary
+
+CATALOG_VERSION_KEY = 'catalog:version:{name}'
+TAGS_CATALOG = 'tags'
+INGREDIENTS_CATALOG = 'ingredients'
+RECIPES_NAMESPACE = 'recipes'
+
+
+def get_versions(names):
+    """
+    Текущие версии нескольких справочников или пространств имен общего
+    кэша одним обращением к кэшу.
+    """
+    keys = {CATALOG_VERSION_KEY.format(name=name): name for name in names}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        cache.add(key, uuid4().hex, None)
+        versions[key] = cache.get(key)
+    return {name: versions[key] for key, name in keys.items()}
+
+
+def bump_version(name):
+    """Смена версии: ключи, построенные на старой версии, не читаются."""
+    cache.set(CATALOG_VERSION_KEY.format(name=name), uuid4().hex, None)
+
+
+def bump_catalog_version(name):
+    """Смена версии справочника: все процессы перечитают его из БД."""
+    bump_version(name)
+    catalog = CATALOGS.get(name)
+    if catalog:
+        catalog.checked = 0
+
+
+class Catalog:
+    """
+    Справочник, закэшированный в памяти процесса.
+
+    Актуальность проверяется по версии в общем кэше не чаще, чем раз в
+    CATALOG_VERSION_CHECK_INTERVAL секунд, поэтому несколько процессов
+    gunicorn согласованы между собой без обращения к таблицам справочника.
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.version = None
+        self.data = None
+        self.checked = 0
+
+    def get_shared_version(self):
+        key = CATALOG_VERSION_KEY.format(name=self.name)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid4().hex, None)
+            version = cache.get(key)
+        return version
+
+    def get(self):
+        """Возвращает пару (версия, данные справочника)."""
+        now = time.monotonic()
+        if now - self.checked > settings.CATALOG_VERSION_CHECK_INTERVAL:
+            version = self.get_shared_version()
+            if version != self.version or self.data is None:
+                with primary():
+                    self.data = self.loader()
+                self.version = version
+            self.checked = now
+        return self.version, self.data
+
+
+CATALOGS = {}
+
+
+def register_catalog(name, loader):
+    CATALOGS[name] = Catalog(name, loader)
+    return CATALOGS[name]
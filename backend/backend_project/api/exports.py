@@ -0,0 +1,119 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .utils import get_shopping_list, lock_user, render_shopping_list_pdf
+from app.models import ShoppingListExport
+
+
+def get_shopping_list_digest(shopping_list):
+    return hashlib.sha256(repr(list(shopping_list)).encode()).hexdigest()
+
+
+@transaction.atomic
+def start_export(user):
+    """
+    Постановка выгрузки в очередь. Если список покупок не менялся с
+    прошлой выгрузки, возвращается уже существующее задание. Строка
+    пользователя блокируется, чтобы параллельные запросы не создали два
+    задания для одного списка.
+    """
+    lock_user(user)
+    digest = get_shopping_list_digest(get_shopping_list(user))
+    exports = ShoppingListExport.objects.filter(user=user)
+    export = exports.filter(digest=digest).exclude(
+        status=ShoppingListExport.FAILED
+    ).last()
+    if export:
+        return export
+    for old_export in exports.exclude(
+        status__in=(ShoppingListExport.PENDING, ShoppingListExport.RUNNING)
+    ):
+        old_export.file.delete(save=False)
+        old_export.delete()
+    return ShoppingListExport.objects.create(user=user, digest=digest)
+
+
+@transaction.atomic
+def claim_export():
+    """
+    Захват следующего задания. Задания, зависшие в работе дольше
+    EXPORT_JOB_TIMEOUT секунд, захватываются повторно.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT)
+    export = ShoppingListExport.objects.select_for_update(
+        skip_locked=connection.features.has_select_for_update_skip_locked
+    ).filter(
+        Q(status=ShoppingListExport.PENDING)
+        | Q(status=ShoppingListExport.RUNNING, updated__lt=stale)
+    ).order_by('created').first()
+    if export:
+        export.status = ShoppingListExport.RUNNING
+        export.save(update_fields=['status', 'updated'])
+    return export
+
+
+@contextmanager
+def heartbeat(export):
+    """
+    Продление захвата задания, пока оно выполняется: поле updated
+    обновляется каждую треть EXPORT_JOB_TIMEOUT, и долгое задание не
+    захватывается повторно как зависшее.
+    """
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(settings.EXPORT_JOB_TIMEOUT / 3):
+                ShoppingListExport.objects.filter(
+                    pk=export.pk, status=ShoppingListExport.RUNNING
+                ).update(updated=timezone.now())
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_export(export):
+    with heartbeat(export):
+        try:
+            buffer = render_shopping_list_pdf(
+                get_shopping_list(export.user)
+            )
+            # Случайное имя: каталог media раздается nginx без авторизации.
+            export.file.save(
+                f'{uuid4().hex}.pdf', ContentFile(buffer.read()), save=False
+            )
+            export.status = ShoppingListExport.DONE
+            export.error = ''
+        except Exception as error:
+            export.status = ShoppingListExport.FAILED
+            export.error = str(error)
+    export.save(update_fields=['status', 'file', 'error', 'updated'])
+
+
+def work(poll_interval, once=False):
+    """Цикл обработчика: выполняет задания по одному, пока они есть."""
+    while True:
+        export = claim_export()
+        if export:
+            run_export(export)
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.db import transaction
+
+from app.models import FeedEntry, Recipe, Subscription, User
+
+BATCH_SIZE = 1000
+FEED_ORDERING = ('-pub_date', '-recipe_id')
+RECIPE_ORDERING = ('-pub_date', '-id')
+
+
+def is_popular(author_id):
+    """Рецепты популярных авторов не рассылаются, а читаются из Recipe."""
+    return User.objects.filter(
+        pk=author_id,
+        followers_count__gte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).exists()
+
+
+def fan_out(recipe):
+    """
+    Добавление нового рецепта в ленты подписчиков автора. Число записей
+    ограничено порогом FEED_FANOUT_MAX_FOLLOWERS.
+    """
+    if is_popular(recipe.author_id):
+        return
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=user_id, recipe=recipe, author_id=recipe.author_id,
+                pub_date=recipe.pub_date
+            )
+            for user_id in Subscription.objects.filter(
+                author_id=recipe.author_id
+            ).values_list('user_id', flat=True).iterator()
+        ],
+        ignore_conflicts=True
+    )
+
+
+def add_author_recipes(user_ids, author_id):
+    """Последние FEED_BACKFILL_SIZE рецептов автора в ленты user_ids."""
+    recipes = list(Recipe.objects.filter(
+        author_id=author_id
+    ).order_by(*RECIPE_ORDERING).values_list(
+        'id', 'pub_date'
+    )[:settings.FEED_BACKFILL_SIZE])
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=user_id, recipe_id=recipe_id, author_id=author_id,
+                pub_date=pub_date
+            )
+            for user_id in user_ids
+            for recipe_id, pub_date in recipes
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill(user_id, author_id):
+    """Последние FEED_BACKFILL_SIZE рецептов автора в ленту подписчика."""
+    if not is_popular(author_id):
+        add_author_recipes([user_id], author_id)
+
+
+def prune(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def followers_changed(author_id, delta):
+    """
+    Переход автора через порог FEED_FANOUT_MAX_FOLLOWERS после подписки
+    (delta > 0) или отписки. Ставший популярным автор читается в ленты из
+    Recipe, его разосланные записи удаляются. Переставшему быть популярным
+    рецепты при публикации не рассылались, ленты всех его подписчиков
+    дополняются.
+    """
+    followers = User.objects.filter(pk=author_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    threshold = settings.FEED_FANOUT_MAX_FOLLOWERS
+    if delta > 0 and followers == threshold:
+        FeedEntry.objects.filter(author_id=author_id).delete()
+    elif delta < 0 and followers == threshold - 1:
+        add_author_recipes(
+            Subscription.objects.filter(author_id=author_id).values_list(
+                'user_id', flat=True
+            ),
+            author_id
+        )
+
+
+@transaction.atomic
+def rebuild_feeds():
+    """Пересборка лент всех пользователей по текущим подпискам."""
+    FeedEntry.objects.all().delete()
+    subscriptions = Subscription.objects.filter(
+        author__followers_count__lt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).order_by().values_list('user_id', 'author_id')
+    for user_id, author_id in subscriptions.iterator():
+        add_author_recipes([user_id], author_id)
+    return subscriptions.count()
+
+
+def get_feed_sources(user):
+    """
+    Выборки ключей (pub_date, id) ленты пользователя: разосланные записи
+    и рецепты популярных авторов из подписок, по индексу каждая.
+    """
+    return (
+        (FeedEntry.objects.filter(user=user), FEED_ORDERING),
+        (
+            Recipe.objects.filter(author__in=Subscription.objects.filter(
+                user=user,
+                author__followers_count__gte=(
+                    settings.FEED_FANOUT_MAX_FOLLOWERS
+                )
+            ).values('author')),
+            RECIPE_ORDERING
+        ),
+    )
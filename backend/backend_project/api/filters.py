@@ -1,27 +1,67 @@
 import django_filters
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
 from django_filters import rest_framework as filters
 
-from app.models import Recipe
+from .search import search_recipes
+from app.models import Recipe, RecipeIngredient, Tag
+
+
+# Сортировки рецептов по оценкам популярности с ключом для курсора
+RECIPE_ORDERINGS = {
+    'popular': ('-popular_score', '-pub_date', '-id'),
+    'trending': ('-trending_score', '-pub_date', '-id'),
+}
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+
+def count_pieces(**lookups):
+    """Подзапрос количества ингредиентов рецепта с условиями lookups."""
+    return Subquery(
+        RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk'), **lookups
+        ).order_by().values('recipe').annotate(
+            count=Count('pk')
+        ).values('count'),
+        output_field=IntegerField()
+    )
 
 
 class RecipeFilter(filters.FilterSet):
     """Фильтр рецептов"""
 
-    tags = django_filters.AllValuesMultipleFilter(
+    tags = django_filters.ModelMultipleChoiceFilter(
         field_name='tag__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all(),
         conjoined=False
     )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
-    author = django_filters.AllValuesFilter(
+    author = django_filters.NumberFilter(
         field_name='author__id'
     )
+    search = filters.CharFilter(method='filter_search')
+    ingredients = NumberInFilter(method='filter_ingredients')
+    exclude_ingredients = NumberInFilter(method='filter_exclude_ingredients')
+    max_missing = filters.NumberFilter(
+        method='filter_max_missing', min_value=0
+    )
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart', 'search',
+            'ingredients', 'exclude_ingredients', 'max_missing', 'ordering'
+        )
 
     def filter_is_favorited(self, queryset, name, value):
         if self.request.user.is_anonymous:
@@ -36,3 +76,52 @@ class RecipeFilter(filters.FilterSet):
         if value:
             return queryset.filter(shopping_recipe__user=self.request.user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
+
+    def filter_ingredients(self, queryset, name, value):
+        """
+        Без max_missing рецепт должен содержать все перечисленные
+        ингредиенты. С max_missing перечисленное — то, что есть у
+        пользователя: рецепту может не хватать не больше max_missing
+        ингредиентов, выше рецепты, использующие больше имеющегося.
+        """
+        ingredient_ids = set(int(pk) for pk in value)
+        if not ingredient_ids:
+            return queryset
+        # Кандидаты выбираются по индексу (ingredient, recipe), подсчеты
+        # делаются только для них
+        matches = RecipeIngredient.objects.filter(
+            ingredient_id__in=ingredient_ids
+        ).order_by().values('recipe')
+        max_missing = self.form.cleaned_data.get('max_missing')
+        if max_missing is None:
+            return queryset.filter(pk__in=matches.annotate(
+                count=Count('pk')
+            ).filter(count=len(ingredient_ids)).values('recipe'))
+        return queryset.filter(pk__in=matches).annotate(
+            used_ingredients=count_pieces(ingredient_id__in=ingredient_ids),
+            missing_ingredients=(
+                count_pieces() - F('used_ingredients')
+            )
+        ).filter(missing_ingredients__lte=max_missing).order_by(
+            '-used_ingredients', 'missing_ingredients', '-pub_date', '-id'
+        )
+
+    def filter_exclude_ingredients(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.exclude(pk__in=RecipeIngredient.objects.filter(
+            ingredient_id__in=value
+        ).values('recipe'))
+
+    def filter_max_missing(self, queryset, name, value):
+        # Учитывается в filter_ingredients
+        return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        # Явная сортировка заменяет порядок поиска и подбора по ингредиентам
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
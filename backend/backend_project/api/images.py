@@ -0,0 +1,99 @@
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .catalog import RECIPES_NAMESPACE, bump_version
+from app.models import Recipe
+
+RENDITION_PATH = 'recipes/renditions/{key}/{name}.{extension}'
+RENDITION_FORMATS = (('JPEG', 'jpg', ''), ('WEBP', 'webp', '_webp'))
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_image_url(name):
+    return settings.MEDIA_URL + str(name)
+
+
+def get_image_renditions(recipe):
+    """
+    Адреса уменьшенных копий изображения рецепта. Пока копии не готовы,
+    вместо них отдается адрес оригинала.
+    """
+    renditions = {}
+    for name in settings.IMAGE_RENDITION_WIDTHS:
+        for _, extension, suffix in RENDITION_FORMATS:
+            renditions[name + suffix] = get_image_url(
+                RENDITION_PATH.format(
+                    key=recipe.image_key, name=name, extension=extension
+                ) if recipe.image_key else recipe.image
+            )
+    return renditions
+
+
+def render(image, width, image_format):
+    image = image.copy()
+    image.thumbnail((width, width * 4))
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=settings.IMAGE_RENDITION_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def make_renditions(recipe_id):
+    """
+    Создание уменьшенных копий изображения рецепта в JPEG и WebP.
+
+    Копии хранятся по хэшу содержимого, поэтому одинаковые изображения
+    обрабатываются один раз.
+    """
+    recipe = Recipe.objects.only('image').get(pk=recipe_id)
+    with recipe.image.open('rb') as f:
+        data = f.read()
+    key = hashlib.sha256(data).hexdigest()[:32]
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    for name, width in settings.IMAGE_RENDITION_WIDTHS.items():
+        for image_format, extension, _ in RENDITION_FORMATS:
+            path = RENDITION_PATH.format(
+                key=key, name=name, extension=extension
+            )
+            if not default_storage.exists(path):
+                default_storage.save(path, render(image, width, image_format))
+    # Ключ записывается, только если изображение не сменилось за время
+    # обработки.
+    if Recipe.objects.filter(pk=recipe_id, image=recipe.image.name).update(
+        image_key=key
+    ):
+        bump_version(RECIPES_NAMESPACE)
+    return key
+
+
+def process_in_background(recipe_id):
+    try:
+        make_renditions(recipe_id)
+    except Exception:
+        logger.exception('Image processing failed for recipe %s', recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_renditions(recipe_id):
+    """Обработка изображения в пуле потоков после фиксации транзакции."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PROCESSING_WORKERS
+        )
+    transaction.on_commit(
+        lambda: _executor.submit(process_in_background, recipe_id)
+    )
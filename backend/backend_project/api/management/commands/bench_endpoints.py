@@ -0,0 +1,182 @@
+import json
+import random
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from app.models import Recipe, User
+
+SEED = 19
+NO_DATA = 'No users with subscriptions, run generate_data first'
+HEADER = '{:<28} {:>9} {:>9} {:>9} {:>8}'
+ROW = '{name:<28} {p50:>9.2f} {p95:>9.2f} {max:>9.2f} {queries:>8}'
+REGRESSION = '{name}: {metric} {baseline} -> {current}'
+REGRESSIONS_FOUND = '{count} regressions against {path}'
+UNEXPECTED_STATUS = '{path} responded with {status}'
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def get_scenarios(user, recipe_ids):
+    """
+    Сценарии бенчмарка: имя, адрес или функция номера итерации,
+    возвращающая адрес, и пользователь (None для анонимного запроса).
+    """
+    return (
+        ('recipes', '/api/recipes/', user),
+        ('recipes_anonymous', '/api/recipes/', None),
+        ('recipes_tags', '/api/recipes/?tags=breakfast&tags=lunch', user),
+        ('recipes_favorited', '/api/recipes/?is_favorited=1', user),
+        ('recipes_in_cart', '/api/recipes/?is_in_shopping_cart=1', user),
+        ('recipes_author', f'/api/recipes/?author={recipe_ids[0][1]}', user),
+        ('recipes_search', '/api/recipes/?search=суп', user),
+        ('recipes_popular', '/api/recipes/?ordering=popular', user),
+        ('recipes_trending', '/api/recipes/?ordering=trending', user),
+        ('recipes_limit_50', '/api/recipes/?limit=50', user),
+        (
+            'recipe_detail',
+            lambda number: (
+                f'/api/recipes/{recipe_ids[number % len(recipe_ids)][0]}/'
+            ),
+            user
+        ),
+        (
+            'recipe_similar',
+            lambda number: (
+                f'/api/recipes/{recipe_ids[number % len(recipe_ids)][0]}'
+                '/similar/'
+            ),
+            None
+        ),
+        ('subscriptions', '/api/users/subscriptions/?recipes_limit=3', user),
+        ('feed', '/api/recipes/feed/', user),
+        ('ingredient_search', '/api/ingredients/?name=сах', None),
+        (
+            'download_shopping_cart',
+            '/api/recipes/download_shopping_cart/', user
+        ),
+    )
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк основных эндпойнтов через тестовый клиент: задержка и число
+    SQL-запросов для каждого сценария. Результаты можно сохранить как
+    базовые и сравнить с ними следующий прогон.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=SEED)
+        parser.add_argument('--user', type=int)
+        parser.add_argument(
+            '--save', type=str, help='Сохранить результаты в JSON-файл'
+        )
+        parser.add_argument(
+            '--compare', type=str, help='Сравнить с сохраненными результатами'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый относительный рост задержки p50'
+        )
+        parser.add_argument(
+            '--min-delta', type=float, default=2.0,
+            help='Рост задержки p50 в мс, который не считается регрессией'
+        )
+
+    def get_user(self, user_id):
+        if user_id is not None:
+            return User.objects.get(pk=user_id)
+        user = User.objects.annotate(
+            subscriptions=Count('follower')
+        ).filter(subscriptions__gt=0).order_by('-subscriptions', 'pk').first()
+        if user is None:
+            raise CommandError(NO_DATA)
+        return user
+
+    def run_scenario(self, url, user, iterations, warmup):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        timings = []
+        queries = 0
+        for number in range(warmup + iterations):
+            path = url(number) if callable(url) else url
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(path)
+                elapsed = (time.perf_counter() - start) * 1000
+            if response.status_code != 200:
+                raise CommandError(UNEXPECTED_STATUS.format(
+                    path=path, status=response.status_code
+                ))
+            if number >= warmup:
+                timings.append(elapsed)
+                queries = max(queries, len(captured))
+        timings.sort()
+        return {
+            'p50': percentile(timings, 0.5),
+            'p95': percentile(timings, 0.95),
+            'max': timings[-1],
+            'queries': queries,
+        }
+
+    def compare(self, results, path, tolerance, min_delta):
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            if current['queries'] > previous['queries']:
+                regressions.append(REGRESSION.format(
+                    name=name, metric='queries',
+                    baseline=previous['queries'], current=current['queries']
+                ))
+            if (
+                current['p50'] > previous['p50'] * (1 + tolerance)
+                and current['p50'] - previous['p50'] > min_delta
+            ):
+                regressions.append(REGRESSION.format(
+                    name=name, metric='p50 ms',
+                    baseline=f'{previous["p50"]:.2f}',
+                    current=f'{current["p50"]:.2f}'
+                ))
+        for regression in regressions:
+            self.stderr.write(regression)
+        if regressions:
+            raise CommandError(
+                REGRESSIONS_FOUND.format(count=len(regressions), path=path)
+            )
+
+    def handle(self, *args, **kwargs):
+        user = self.get_user(kwargs['user'])
+        recipe_ids = list(
+            Recipe.objects.order_by('pk').values_list('pk', 'author_id')
+        )
+        random.Random(kwargs['seed']).shuffle(recipe_ids)
+        self.stdout.write(
+            HEADER.format('scenario', 'p50 ms', 'p95 ms', 'max ms', 'queries')
+        )
+        results = {}
+        for name, url, client_user in get_scenarios(user, recipe_ids):
+            results[name] = self.run_scenario(
+                url, client_user, kwargs['iterations'], kwargs['warmup']
+            )
+            self.stdout.write(ROW.format(name=name, **results[name]))
+        if kwargs['save']:
+            with open(kwargs['save'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if kwargs['compare']:
+            self.compare(
+                results, kwargs['compare'], kwargs['tolerance'],
+                kwargs['min_delta']
+            )
@@ -0,0 +1,103 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from api.filters import RecipeFilter
+from app.models import Ingredient, Recipe, RecipeIngredient
+
+User = get_user_model()
+
+BATCH_SIZE = 2000
+SEED = 16
+GENERATED = 'Generated {count} recipes with {pieces} ingredients each'
+REPORT = (
+    '{mode}: {count} queries with {size} ingredients, p50 {p50:.3f} ms,'
+    ' p99 {p99:.3f} ms, max {max:.3f} ms'
+)
+MODES = (
+    ('contains all', 'ingredients', {}),
+    ('contains none', 'exclude_ingredients', {}),
+    ('missing at most 2', 'ingredients', {'max_missing': 2}),
+)
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк фильтра рецептов по набору ингредиентов: генерирует корпус
+    рецептов и замеряет фильтрацию с ingredients, exclude_ingredients и
+    max_missing. Корпус создается в транзакции, которая откатывается.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000)
+        parser.add_argument('--pieces', type=int, default=10)
+        parser.add_argument('--query-size', type=int, default=20)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=SEED)
+
+    def generate(self, generator, ingredient_ids, count, pieces):
+        username = f'bench-ingredients-{time.time_ns()}'
+        author = User.objects.create(
+            username=username, email=f'{username}@example.com'
+        )
+        for offset in range(0, count, BATCH_SIZE):
+            size = min(BATCH_SIZE, count - offset)
+            Recipe.objects.bulk_create([
+                Recipe(
+                    author=author, name=f'Рецепт {offset + position}',
+                    text='', image='recipes/images/bench.jpg',
+                    cooking_time=1,
+                    slug=f'bench-{author.pk}-{offset + position}'
+                ) for position in range(size)
+            ])
+            recipe_ids = Recipe.objects.filter(author=author).order_by(
+                '-pk'
+            ).values_list('pk', flat=True)[:size]
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id,
+                    amount=1
+                )
+                for recipe_id in recipe_ids
+                for ingredient_id in generator.sample(ingredient_ids, pieces)
+            ])
+        return author
+
+    def measure(self, queryset, params):
+        start = time.perf_counter()
+        list(RecipeFilter(params, queryset).qs[:10])
+        return (time.perf_counter() - start) * 1000
+
+    def handle(self, *args, **kwargs):
+        generator = random.Random(kwargs['seed'])
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+        with transaction.atomic():
+            author = self.generate(
+                generator, ingredient_ids, kwargs['count'], kwargs['pieces']
+            )
+            self.stdout.write(GENERATED.format(**kwargs))
+            recipes = Recipe.objects.filter(author=author)
+            for mode, param, extra in MODES:
+                timings = []
+                for _ in range(kwargs['queries']):
+                    ids = generator.sample(
+                        ingredient_ids, kwargs['query_size']
+                    )
+                    params = dict(
+                        extra, **{param: ','.join(str(pk) for pk in ids)}
+                    )
+                    timings.append(self.measure(recipes, params))
+                timings.sort()
+                self.stdout.write(REPORT.format(
+                    mode=mode, count=len(timings), size=kwargs['query_size'],
+                    p50=percentile(timings, 0.5),
+                    p99=percentile(timings, 0.99), max=timings[-1]
+                ))
+            transaction.set_rollback(True)
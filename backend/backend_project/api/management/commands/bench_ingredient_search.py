@@ -0,0 +1,63 @@
+import csv
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from api.search import IngredientIndex, search_ingredients
+from app.models import Ingredient
+
+P99_EXCEEDED = 'p99 {p99:.3f} ms exceeds the target of {target} ms'
+REPORT = (
+    '{count} keystrokes: p50 {p50:.3f} ms, p99 {p99:.3f} ms,'
+    ' max {max:.3f} ms'
+)
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк автодополнения ингредиентов: каждое название из CSV
+    набирается посимвольно, для каждого нажатия замеряется время поиска.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', type=str, required=True)
+        parser.add_argument(
+            '--db', action='store_true',
+            help='Искать через базу данных, а не по индексу из CSV'
+        )
+        parser.add_argument('--step', type=int, default=10)
+        parser.add_argument('--p99-target', type=float, default=5.0)
+
+    def handle(self, *args, **kwargs):
+        with open(kwargs['path'], newline='', encoding='utf-8') as f:
+            names = [line[0] for line in csv.reader(f)]
+        if kwargs['db']:
+            search = search_ingredients
+        else:
+            index = IngredientIndex(
+                Ingredient(id=pk, name=name, measurement_unit='')
+                for pk, name in enumerate(names, start=1)
+            )
+            search = index.search
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        timings = []
+        for name in names[::kwargs['step']]:
+            for length in range(1, len(name) + 1):
+                start = time.perf_counter()
+                search(name[:length], limit)
+                timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p99 = percentile(timings, 0.99)
+        self.stdout.write(REPORT.format(
+            count=len(timings), p50=percentile(timings, 0.5), p99=p99,
+            max=timings[-1]
+        ))
+        if p99 > kwargs['p99_target']:
+            raise CommandError(
+                P99_EXCEEDED.format(p99=p99, target=kwargs['p99_target'])
+            )
@@ -0,0 +1,139 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+
+from api.filters import RecipeFilter
+from api.popularity import decay_scores
+from app.models import FavoriteRecipe, Recipe, ShoppingCart
+
+User = get_user_model()
+
+BATCH_SIZE = 2000
+SEED = 24
+GENERATED = 'Generated {count} recipes, {events} favorites and carts'
+REPORT = (
+    '{mode}: {count} queries, p50 {p50:.3f} ms, p99 {p99:.3f} ms,'
+    ' max {max:.3f} ms'
+)
+DECAYED = 'Decay of {count} scores: {elapsed:.1f} ms'
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def count_events(queryset):
+    """Популярность, посчитанная COUNT при запросе, для сравнения."""
+    return queryset.annotate(
+        events=Count('favorite_recipe', distinct=True)
+        + Count('shopping_recipe', distinct=True)
+    ).order_by('-events', '-pub_date', '-id')
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк сортировок рецептов: по дате, по популярности, посчитанной
+    COUNT при запросе, и по индексированным оценкам popular и trending,
+    а также затухания оценок. Корпус создается в транзакции, которая
+    откатывается.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--events', type=int, default=3)
+        parser.add_argument('--page', type=int, default=1)
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=SEED)
+
+    def bulk_create(self, model, objects):
+        objects = list(objects)
+        # На SQLite размер пачки ограничен числом параметров запроса
+        model.objects.bulk_create(objects, batch_size=min(
+            BATCH_SIZE, connection.ops.bulk_batch_size(
+                model._meta.concrete_fields, objects
+            )
+        ), ignore_conflicts=True)
+
+    def generate(self, generator, count, users, events):
+        prefix = f'bench-ordering-{time.time_ns()}'
+        self.bulk_create(User, (
+            User(username=f'{prefix}-{number}',
+                 email=f'{prefix}-{number}@example.com')
+            for number in range(users)
+        ))
+        user_ids = list(User.objects.filter(
+            username__startswith=prefix
+        ).values_list('pk', flat=True))
+        author_id = user_ids[0]
+        for offset in range(0, count, BATCH_SIZE):
+            self.bulk_create(Recipe, (
+                Recipe(
+                    author_id=author_id, name=f'Рецепт {offset + position}',
+                    text='', image='recipes/images/bench.jpg',
+                    cooking_time=1, slug=f'{prefix}-{offset + position}',
+                    popular_score=generator.expovariate(0.1),
+                    trending_score=generator.expovariate(0.5)
+                ) for position in range(min(BATCH_SIZE, count - offset))
+            ))
+        recipe_ids = list(Recipe.objects.filter(
+            author_id=author_id
+        ).values_list('pk', flat=True))
+        for model in (FavoriteRecipe, ShoppingCart):
+            self.bulk_create(model, (
+                model(user_id=generator.choice(user_ids), recipe_id=pk)
+                for pk in recipe_ids
+                for _ in range(generator.randint(0, events))
+            ))
+        return Recipe.objects.filter(author_id=author_id)
+
+    def measure(self, queryset, page, queries):
+        timings = []
+        for _ in range(queries):
+            start = time.perf_counter()
+            list(queryset[(page - 1) * 10:page * 10])
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return timings
+
+    def handle(self, *args, **kwargs):
+        generator = random.Random(kwargs['seed'])
+        with transaction.atomic():
+            recipes = self.generate(
+                generator, kwargs['count'], kwargs['users'], kwargs['events']
+            )
+            self.stdout.write(GENERATED.format(
+                count=recipes.count(),
+                events=(
+                    FavoriteRecipe.objects.filter(recipe__in=recipes).count()
+                    + ShoppingCart.objects.filter(recipe__in=recipes).count()
+                )
+            ))
+            modes = (
+                ('newest', recipes.order_by('-pub_date', '-id')),
+                ('popular by COUNT', count_events(recipes)),
+                ('popular', RecipeFilter({'ordering': 'popular'}, recipes).qs),
+                (
+                    'trending',
+                    RecipeFilter({'ordering': 'trending'}, recipes).qs
+                ),
+            )
+            for mode, queryset in modes:
+                timings = self.measure(
+                    queryset, kwargs['page'], kwargs['queries']
+                )
+                self.stdout.write(REPORT.format(
+                    mode=mode, count=len(timings),
+                    p50=percentile(timings, 0.5),
+                    p99=percentile(timings, 0.99), max=timings[-1]
+                ))
+            start = time.perf_counter()
+            count = decay_scores(60 * 60)
+            self.stdout.write(DECAYED.format(
+                count=count, elapsed=(time.perf_counter() - start) * 1000
+            ))
+            transaction.set_rollback(True)
@@ -0,0 +1,108 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from api.search import search_recipes
+from app.models import Ingredient, Recipe
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+SEED = 15
+NAME_WORDS = 3
+TEXT_WORDS = 40
+GENERATED = 'Generated {count} recipes in {elapsed:.1f} s'
+REPORT = (
+    '{count} queries: p50 {p50:.3f} ms, p99 {p99:.3f} ms, max {max:.3f} ms,'
+    ' {found:.1f} results on the first page on average'
+)
+VOCABULARY = (
+    'суп салат пирог каша запеканка рагу соус омлет блины котлеты '
+    'жареный тушеный запеченный вареный свежий домашний быстрый '
+    'нарезать смешать обжарить добавить посолить поперчить варить '
+    'запекать остудить подавать минут духовке сковороде кастрюле'
+).split()
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def words(generator, vocabulary, count):
+    return ' '.join(generator.choice(vocabulary) for _ in range(count))
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк поиска рецептов: генерирует корпус рецептов, строит для него
+    поисковый индекс и замеряет время поисковых запросов. Корпус
+    создается в транзакции, которая по умолчанию откатывается.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=SEED)
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Сохранить сгенерированный корпус в базе'
+        )
+
+    def generate(self, generator, vocabulary, count, batch_size):
+        username = f'bench-search-{time.time_ns()}'
+        author = User.objects.create(
+            username=username, email=f'{username}@example.com'
+        )
+        created = 0
+        while created < count:
+            size = min(batch_size, count - created)
+            recipes = Recipe.objects.bulk_create([
+                Recipe(
+                    author=author,
+                    name=words(generator, vocabulary, NAME_WORDS),
+                    text=words(generator, vocabulary, TEXT_WORDS),
+                    image='recipes/images/bench.jpg',
+                    cooking_time=generator.randint(1, 180),
+                    slug=f'bench-{author.pk}-{created + position}'
+                ) for position in range(size)
+            ])
+            if recipes[0].pk is None:
+                recipes = list(Recipe.objects.filter(
+                    author=author
+                ).order_by('-pk')[:size])
+            Recipe.update_search_index(recipes)
+            created += size
+        return author
+
+    def handle(self, *args, **kwargs):
+        generator = random.Random(kwargs['seed'])
+        vocabulary = VOCABULARY + list(
+            Ingredient.objects.values_list('name', flat=True)[:500]
+        )
+        with transaction.atomic():
+            start = time.monotonic()
+            author = self.generate(
+                generator, vocabulary, kwargs['count'], kwargs['batch_size']
+            )
+            self.stdout.write(GENERATED.format(
+                count=kwargs['count'], elapsed=time.monotonic() - start
+            ))
+            recipes = Recipe.objects.filter(author=author)
+            timings = []
+            found = 0
+            for _ in range(kwargs['queries']):
+                query = words(generator, vocabulary, generator.randint(1, 2))
+                start = time.perf_counter()
+                found += len(search_recipes(recipes, query)[:10])
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write(REPORT.format(
+                count=len(timings), p50=percentile(timings, 0.5),
+                p99=percentile(timings, 0.99), max=timings[-1],
+                found=found / len(timings)
+            ))
+            transaction.set_rollback(not kwargs['keep'])
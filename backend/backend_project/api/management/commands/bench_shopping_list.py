@@ -0,0 +1,150 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from api.utils import get_shopping_list
+from app.models import (
+    Ingredient, Recipe, RecipeIngredient, ShoppingCart, ShoppingListItem
+)
+
+User = get_user_model()
+
+BATCH_SIZE = 2000
+SEED = 1
+REPORT = (
+    '{recipes} recipes in other carts: {count} queries, p50 {p50:.3f} ms,'
+    ' p99 {p99:.3f} ms, max {max:.3f} ms'
+)
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк сводного списка покупок: время сборки списка пользователя с
+    неизменной корзиной по мере роста числа рецептов в корзинах других
+    пользователей. Время не должно расти вместе с данными. Данные
+    создаются в транзакции, которая откатывается.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--steps', type=int, nargs='+', default=[1000, 10000, 100000]
+        )
+        parser.add_argument('--cart', type=int, default=10)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--pieces', type=int, default=10)
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=SEED)
+
+    def bulk_create(self, model, objects):
+        objects = list(objects)
+        # На SQLite размер пачки ограничен числом параметров запроса
+        model.objects.bulk_create(objects, batch_size=min(
+            BATCH_SIZE, connection.ops.bulk_batch_size(
+                model._meta.concrete_fields, objects
+            )
+        ))
+
+    def create_recipes(self, generator, prefix, author, start, count,
+                       ingredient_ids, pieces):
+        """Рецепты с номерами start..start + count со случайным составом."""
+        for offset in range(start, start + count, BATCH_SIZE):
+            numbers = range(offset, min(offset + BATCH_SIZE, start + count))
+            self.bulk_create(Recipe, (
+                Recipe(
+                    author=author, name=f'Рецепт {number}', text='',
+                    image='recipes/images/bench.jpg', cooking_time=1,
+                    slug=f'{prefix}-{number}'
+                ) for number in numbers
+            ))
+            recipe_ids = list(Recipe.objects.filter(slug__in=[
+                f'{prefix}-{number}' for number in numbers
+            ]).values_list('pk', flat=True))
+            self.bulk_create(RecipeIngredient, (
+                RecipeIngredient(
+                    recipe_id=pk, ingredient_id=ingredient_id,
+                    amount=generator.randint(1, 100)
+                )
+                for pk in recipe_ids
+                for ingredient_id in generator.sample(ingredient_ids, pieces)
+            ))
+            yield recipe_ids
+
+    def fill_shopping_list(self, user):
+        """Список покупок по корзине: bulk_create его не поддерживает."""
+        self.bulk_create(ShoppingListItem, (
+            ShoppingListItem(
+                user=user, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe__shopping_recipe__user=user
+            ).values('ingredient_id').annotate(
+                amount=Sum('amount')
+            ).values_list('ingredient_id', 'amount')
+        ))
+
+    def measure(self, user, queries):
+        timings = []
+        for _ in range(queries):
+            start = time.perf_counter()
+            list(get_shopping_list(user))
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return timings
+
+    def handle(self, *args, **kwargs):
+        generator = random.Random(kwargs['seed'])
+        prefix = f'bench-shopping-list-{time.time_ns()}'
+        with transaction.atomic():
+            self.bulk_create(User, (
+                User(username=f'{prefix}-{number}',
+                     email=f'{prefix}-{number}@example.com')
+                for number in range(kwargs['users'] + 1)
+            ))
+            user, *others = User.objects.filter(
+                username__startswith=prefix
+            ).order_by('pk')
+            self.bulk_create(Ingredient, (
+                Ingredient(name=f'{prefix}-{number}', measurement_unit='г')
+                for number in range(kwargs['ingredients'])
+            ))
+            ingredient_ids = list(Ingredient.objects.filter(
+                name__startswith=prefix
+            ).values_list('pk', flat=True))
+            pieces = min(kwargs['pieces'], len(ingredient_ids))
+            for recipe_ids in self.create_recipes(
+                generator, prefix, user, 0, kwargs['cart'], ingredient_ids,
+                pieces
+            ):
+                self.bulk_create(ShoppingCart, (
+                    ShoppingCart(user=user, recipe_id=pk)
+                    for pk in recipe_ids
+                ))
+            self.fill_shopping_list(user)
+            created = 0
+            for step in sorted(kwargs['steps']):
+                for recipe_ids in self.create_recipes(
+                    generator, prefix, user, kwargs['cart'] + created,
+                    step - created, ingredient_ids, pieces
+                ):
+                    self.bulk_create(ShoppingCart, (
+                        ShoppingCart(
+                            user=generator.choice(others), recipe_id=pk
+                        ) for pk in recipe_ids
+                    ))
+                created = max(created, step)
+                timings = self.measure(user, kwargs['queries'])
+                self.stdout.write(REPORT.format(
+                    recipes=created, count=len(timings),
+                    p50=percentile(timings, 0.5),
+                    p99=percentile(timings, 0.99), max=timings[-1]
+                ))
+            transaction.set_rollback(True)
@@ -0,0 +1,59 @@
+import json
+
+from django.core.management import BaseCommand, CommandError
+
+from api.snapshots import BATCH_SIZE, build_snapshots, refresh_snapshots
+from app.models import Recipe, RecipeSnapshot
+
+CHECKED = '{count} recipes checked: {missing} missing, {stale} stale snapshots'
+STALE = 'Stale snapshot of recipe {pk}'
+REFRESHED = '{count} snapshots refreshed'
+INCONSISTENT = 'Snapshots are stale, run with --fix to refresh them'
+
+
+class Command(BaseCommand):
+    """
+    Менеджмент команда для сверки снимков рецептов со свежей сериализацией.
+    Отсутствующие и сброшенные снимки допустимы, они собираются при чтении;
+    устаревшие означают пропущенную инвалидацию. С --fix снимки
+    пересобираются.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def check_batch(self, recipe_ids):
+        stored = dict(RecipeSnapshot.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'data'))
+        missing, stale = [], []
+        for pk, data in build_snapshots(recipe_ids).items():
+            if not stored.get(pk):
+                missing.append(pk)
+            elif json.loads(stored[pk]) != json.loads(json.dumps(data)):
+                stale.append(pk)
+        return missing, stale
+
+    def handle(self, *args, **kwargs):
+        recipe_ids = list(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        batch_size = kwargs['batch_size']
+        missing, stale = [], []
+        for start in range(0, len(recipe_ids), batch_size):
+            batch_missing, batch_stale = self.check_batch(
+                recipe_ids[start:start + batch_size]
+            )
+            missing += batch_missing
+            stale += batch_stale
+        for pk in stale:
+            self.stderr.write(STALE.format(pk=pk))
+        self.stdout.write(CHECKED.format(
+            count=len(recipe_ids), missing=len(missing), stale=len(stale)
+        ))
+        if kwargs['fix']:
+            refresh_snapshots(missing + stale)
+            self.stdout.write(REFRESHED.format(count=len(missing + stale)))
+        elif stale:
+            raise CommandError(INCONSISTENT)
@@ -0,0 +1,50 @@
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from api.popularity import (
+    BATCH_SIZE, decay_scores, get_decayed_at, rebuild_scores, set_decayed_at
+)
+
+REBUILT = '{count} recipe scores rebuilt from favorites and carts'
+DECAYED = '{count} recipe scores decayed for {hours:.2f} h'
+NO_PREVIOUS_RUN = 'No previous run recorded, scores will decay from now on'
+
+
+class Command(BaseCommand):
+    """
+    Менеджмент команда для затухания оценок популярности рецептов за время
+    с прошлого запуска. Запускается по расписанию, например раз в час.
+    С --rebuild оценки пересчитываются по датам добавления в избранное и
+    корзины.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true')
+        parser.add_argument(
+            '--hours', type=float,
+            help='Затухание за указанное время вместо времени с прошлого '
+                 'запуска'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **kwargs):
+        now = timezone.now()
+        if kwargs['rebuild']:
+            count = rebuild_scores(now)
+            set_decayed_at(now)
+            self.stdout.write(REBUILT.format(count=count))
+            return
+        if kwargs['hours'] is not None:
+            elapsed = kwargs['hours'] * 60 * 60
+        else:
+            decayed_at = get_decayed_at()
+            if decayed_at is None:
+                set_decayed_at(now)
+                self.stdout.write(NO_PREVIOUS_RUN)
+                return
+            elapsed = (now - decayed_at).total_seconds()
+        count = decay_scores(elapsed, kwargs['batch_size'])
+        set_decayed_at(now)
+        self.stdout.write(
+            DECAYED.format(count=count, hours=elapsed / 60 / 60)
+        )
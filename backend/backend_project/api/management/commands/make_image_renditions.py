@@ -0,0 +1,36 @@
+from django.core.management import BaseCommand
+
+from api.images import make_renditions
+from app.models import Recipe
+
+RENDITIONS_MADE = 'Renditions made for {count} recipes'
+RENDITIONS_FAILED = 'Recipe {pk}: {error}'
+
+
+class Command(BaseCommand):
+    """
+    Менеджмент команда для создания уменьшенных копий изображений
+    уже существующих рецептов.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Обработать и рецепты, у которых копии уже есть'
+        )
+
+    def handle(self, *args, **kwargs):
+        recipes = Recipe.objects.all()
+        if not kwargs['all']:
+            recipes = recipes.filter(image_key='')
+        count = 0
+        for pk in recipes.values_list('pk', flat=True).iterator():
+            try:
+                make_renditions(pk)
+            except (OSError, ValueError) as error:
+                self.stderr.write(RENDITIONS_FAILED.format(pk=pk, error=error))
+                continue
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            RENDITIONS_MADE.format(count=count)
+        ))
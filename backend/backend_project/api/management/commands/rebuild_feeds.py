@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand
+
+from api.feed import rebuild_feeds
+
+FEEDS_REBUILT = 'Feeds rebuilt for {count} subscriptions'
+
+
+class Command(BaseCommand):
+    """
+    Менеджмент команда для пересборки лент подписок, например после
+    массовой загрузки данных или изменения FEED_FANOUT_MAX_FOLLOWERS.
+    """
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write(self.style.SUCCESS(
+            FEEDS_REBUILT.format(count=rebuild_feeds())
+        ))
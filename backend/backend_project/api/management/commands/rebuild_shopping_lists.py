@@ -0,0 +1,68 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.utils import get_live_shopping_lists
+from app.models import ShoppingListItem
+
+BATCH_SIZE = 1000
+LISTS_REBUILT = 'Shopping lists rebuilt: {count} items'
+LISTS_CONSISTENT = 'Shopping lists are consistent: {count} items'
+LISTS_INCONSISTENT = 'Shopping lists differ from carts in {count} items'
+
+
+def get_stored_shopping_lists():
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount
+        in ShoppingListItem.objects.filter(amount__gt=0).values_list(
+            'user_id', 'ingredient_id', 'amount'
+        ).iterator()
+    }
+
+
+def count_differences(stored, live):
+    return sum(
+        stored.get(key) != live.get(key) for key in set(stored) | set(live)
+    )
+
+
+@transaction.atomic
+def rebuild_shopping_lists(live):
+    ShoppingListItem.objects.all().delete()
+    items = [
+        ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, amount=amount
+        )
+        for (user_id, ingredient_id), amount in live.items()
+    ]
+    # На SQLite размер пачки ограничен числом параметров запроса
+    ShoppingListItem.objects.bulk_create(items, batch_size=min(
+        BATCH_SIZE, connection.ops.bulk_batch_size(
+            ShoppingListItem._meta.concrete_fields, items
+        )
+    ))
+
+
+class Command(BaseCommand):
+    """
+    Менеджмент команда для пересборки и сверки списков покупок
+    с актуальным содержимым корзин.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только сверить списки покупок, не пересобирая их'
+        )
+
+    def handle(self, *args, **kwargs):
+        live = get_live_shopping_lists()
+        if not kwargs.get('verify'):
+            rebuild_shopping_lists(live)
+            self.stdout.write(LISTS_REBUILT.format(count=len(live)))
+        differences = count_differences(get_stored_shopping_lists(), live)
+        if differences:
+            raise CommandError(LISTS_INCONSISTENT.format(count=differences))
+        self.stdout.write(
+            self.style.SUCCESS(LISTS_CONSISTENT.format(count=len(live)))
+        )
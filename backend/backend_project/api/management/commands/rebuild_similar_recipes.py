@@ -0,0 +1,31 @@
+import time
+
+from django.core.management import BaseCommand
+
+from api.similarity import BATCH_SIZE, rebuild_similar_recipes
+
+REBUILT = (
+    'Similar recipes rebuilt for {recipes} recipes: {rows} rows'
+    ' in {elapsed:.1f} s'
+)
+
+
+class Command(BaseCommand):
+    """
+    Менеджмент команда для полного пересчета похожих рецептов. Запускается
+    по расписанию и после массовой загрузки данных; между запусками списки
+    обновляются при создании и изменении рецептов.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **kwargs):
+        start = time.monotonic()
+        recipes, rows = rebuild_similar_recipes(
+            kwargs['count'], kwargs['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(REBUILT.format(
+            recipes=recipes, rows=rows, elapsed=time.monotonic() - start
+        )))
@@ -0,0 +1,45 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from app.models import FavoriteRecipe, Recipe, ShoppingCart, Subscription, User
+
+COUNTER_REPAIRED = '{model}.{field}: {count} rows repaired'
+
+
+def count_related(model, field):
+    """Подзапрос количества связанных объектов по полю field."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', count_related(FavoriteRecipe, 'recipe')),
+    (Recipe, 'shopping_carts_count', count_related(ShoppingCart, 'recipe')),
+    (User, 'recipes_count', count_related(Recipe, 'author')),
+    (User, 'followers_count', count_related(Subscription, 'author')),
+)
+
+
+class Command(BaseCommand):
+    """
+    Менеджмент команда для сверки денормализованных счетчиков с данными
+    и исправления расхождений.
+    """
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        for model, field, actual in COUNTERS:
+            drifted = model.objects.annotate(actual=actual).filter(
+                ~Q(**{field: F('actual')})
+            )
+            count = model.objects.filter(
+                pk__in=list(drifted.values_list('pk', flat=True))
+            ).update(**{field: actual})
+            self.stdout.write(COUNTER_REPAIRED.format(
+                model=model.__name__, field=field, count=count
+            ))
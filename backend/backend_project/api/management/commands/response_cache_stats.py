@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand
+
+from api.response_cache import HIT, MISS, response_cache_stats
+
+REPORT = 'hits {hits}, misses {misses}, hit rate {rate:.1%}'
+
+
+class Command(BaseCommand):
+    """Менеджмент команда для вывода счетчиков общего кэша ответов."""
+
+    def handle(self, *args, **kwargs):
+        stats = response_cache_stats.get()
+        total = stats[HIT] + stats[MISS]
+        self.stdout.write(REPORT.format(
+            hits=stats[HIT], misses=stats[MISS],
+            rate=stats[HIT] / total if total else 0
+        ))
@@ -0,0 +1,37 @@
+from multiprocessing import Process
+
+from django.core.management import BaseCommand
+from django.db import connections
+
+from api.exports import work
+
+
+class Command(BaseCommand):
+    """
+    Менеджмент команда для запуска обработчика выгрузок списков покупок.
+    При --concurrency больше 1 запускается несколько процессов.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить задания из очереди и завершиться'
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs['concurrency'] <= 1:
+            work(kwargs['poll_interval'], kwargs['once'])
+            return
+        # Соединения с БД не должны наследоваться дочерними процессами.
+        connections.close_all()
+        workers = [
+            Process(
+                target=work, args=(kwargs['poll_interval'], kwargs['once'])
+            ) for _ in range(kwargs['concurrency'])
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
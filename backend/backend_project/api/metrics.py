@@ -0,0 +1,147 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING_HEADER = 'Server-Timing'
+TIMINGS = ('db', 'view', 'serializer', 'render', 'total')
+
+
+class RequestMetrics:
+    """Замеры одного запроса, время в миллисекундах."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.timings = dict.fromkeys(TIMINGS, 0.0)
+        self.view_started = None
+        self.render_started = None
+        self.serializer_depth = 0
+
+    @staticmethod
+    def since(start):
+        return (time.perf_counter() - start) * 1000
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = self.since(start)
+            self.timings['db'] += duration
+            self.queries.append((duration, context['connection'].alias, sql))
+
+    def finish(self):
+        self.timings['total'] = self.since(self.started)
+        if self.render_started is not None:
+            self.timings['render'] = self.since(self.render_started)
+        if self.view_started is not None:
+            self.timings['view'] = (
+                self.timings['total'] - self.timings['render']
+                - (self.view_started - self.started) * 1000
+            )
+
+    def get_server_timing(self):
+        return ', '.join(
+            f'{name};dur={duration:.1f}'
+            + (f';desc="{len(self.queries)} queries"' if name == 'db' else '')
+            for name, duration in self.timings.items()
+        )
+
+    def get_slowest_queries(self):
+        return sorted(self.queries, reverse=True)[
+            :settings.REQUEST_METRICS_SLOW_QUERIES
+        ]
+
+
+class RequestMetricsMiddleware:
+    """
+    Замеры времени запроса: число и время SQL-запросов, время вью,
+    сериализаторов и рендеринга. Результат отдается в заголовке
+    Server-Timing и пишется строкой JSON в лог api.metrics, для
+    медленных запросов в лог попадают самые медленные SQL-запросы.
+
+    Включается настройкой REQUEST_METRICS_ENABLED и должна стоять первой
+    в MIDDLEWARE, чтобы замер охватывал остальные обработчики.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics = metrics = RequestMetrics()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(metrics.execute)
+                )
+            response = self.get_response(request)
+        metrics.finish()
+        response[SERVER_TIMING_HEADER] = metrics.get_server_timing()
+        self.log(request, response, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Вызывается после вью непосредственно перед рендерингом ответа
+        request.metrics.render_started = time.perf_counter()
+        return response
+
+    def log(self, request, response, metrics):
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': len(metrics.queries),
+        }
+        record.update(
+            (f'{name}_ms', round(duration, 1))
+            for name, duration in metrics.timings.items()
+        )
+        slow = (
+            metrics.timings['total'] > settings.REQUEST_METRICS_SLOW_REQUEST_MS
+            or any(
+                duration > settings.REQUEST_METRICS_SLOW_SQL_MS
+                for duration, _, _ in metrics.queries
+            )
+        )
+        if slow:
+            record['slowest_queries'] = [
+                {'ms': round(duration, 1), 'db': alias, 'sql': sql}
+                for duration, alias, sql in metrics.get_slowest_queries()
+            ]
+        logger.log(
+            logging.WARNING if slow else logging.INFO,
+            json.dumps(record, ensure_ascii=False)
+        )
+
+
+class TimedSerializerMixin:
+    """
+    Учет времени сериализации в замерах запроса. Вложенные сериализаторы
+    и элементы списка учитываются внутри внешнего вызова один раз.
+    """
+
+    def to_representation(self, instance):
+        request = self.context.get('request')
+        metrics = getattr(request, 'metrics', None)
+        if metrics is None:
+            return super().to_representation(instance)
+        start = time.perf_counter()
+        metrics.serializer_depth += 1
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_depth -= 1
+            if not metrics.serializer_depth:
+                metrics.timings['serializer'] += metrics.since(start)
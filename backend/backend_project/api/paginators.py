@@ -1,6 +1,229 @@
+import base64
+import binascii
+import hashlib
+import json
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .catalog import get_versions
+
+COUNT_CACHE_KEY = 'count:{digest}'
+INVALID_CURSOR = 'Invalid cursor'
+
+
+def get_cached_count(queryset, namespaces=()):
+    """
+    Количество объектов выборки с кэшированием по тексту запроса и
+    версиям пространств имен namespaces на PAGINATION_COUNT_CACHE_TIMEOUT
+    секунд. Запись в пространство имен сбрасывает закэшированные числа.
+    Считаются только ключи: аннотации с флагами пользователя не попадают
+    ни в запрос, ни в ключ кэша, и число общее для всех пользователей.
+    """
+    queryset = queryset.order_by().values('pk')
+    try:
+        query = str(queryset.query)
+    except EmptyResultSet:
+        return 0
+    versions = sorted(get_versions(namespaces).items())
+    key = COUNT_CACHE_KEY.format(digest=hashlib.md5(
+        json.dumps([query, versions]).encode()
+    ).hexdigest())
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+
+    def __init__(self, *args, namespaces=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.namespaces = namespaces
+
+    @cached_property
+    def count(self):
+        return get_cached_count(self.object_list, self.namespaces)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(
+        json.dumps(values, default=lambda value: value.isoformat()).encode()
+    ).decode()
+
+
+def decode_cursor(cursor, ordering, model):
+    """
+    Значения ключа сортировки из курсора, приведенные к типам полей
+    модели model. Подделанный курсор дает 404, а не ошибку в запросе.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise NotFound(INVALID_CURSOR)
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise NotFound(INVALID_CURSOR)
+    fields = [
+        model._meta.get_field(field.lstrip('-')) for field in ordering
+    ]
+    try:
+        values = [
+            field.to_python(value) for field, value in zip(fields, values)
+        ]
+    except (ValidationError, TypeError, ValueError):
+        raise NotFound(INVALID_CURSOR)
+    if None in values:
+        raise NotFound(INVALID_CURSOR)
+    return values
+
+
+def get_keyset_filter(ordering, values):
+    """
+    Условие «после курсора» для составного ключа сортировки, например
+    pub_date < x OR (pub_date = x AND id < y) для ('-pub_date', '-id').
+    """
+    condition = Q()
+    for position, field in enumerate(ordering):
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        clause = Q(**{f'{field.lstrip("-")}__{lookup}': values[position]})
+        for previous, value in zip(ordering[:position], values):
+            clause &= Q(**{previous.lstrip('-'): value})
+        condition |= clause
+    return condition
 
 
 class PageLimitPagination(PageNumberPagination):
+    """
+    Постраничная пагинация.
+
+    Для вью с атрибутом cursor_ordering доступен режим курсора
+    (?cursor=), в котором страница выбирается по ключу сортировки без
+    OFFSET; количество объектов в нем считается только по ?count=true.
+    Вью с атрибутом count_cache_namespaces кэшируют количество объектов,
+    если выборка не зависит от пользователя: фильтры из атрибута
+    user_count_filters и ?exact_count=true считают его точно.
+    """
 
     page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    exact_count_query_param = 'exact_count'
+
+    def is_requested(self, request, param):
+        return request.query_params.get(param) in ('true', '1')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        namespaces = getattr(view, 'count_cache_namespaces', None)
+        if (
+            namespaces is None
+            or self.is_requested(request, self.exact_count_query_param)
+            or any(
+                param in request.query_params
+                for param in getattr(view, 'user_count_filters', ())
+            )
+        ):
+            self.django_paginator_class = Paginator
+        else:
+            self.django_paginator_class = partial(
+                CachedCountPaginator, namespaces=namespaces
+            )
+        self.cursor_ordering = getattr(view, 'cursor_ordering', None)
+        self.cursor_mode = bool(
+            self.cursor_ordering
+            and self.cursor_query_param in request.query_params
+        )
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_by_cursor(queryset, request)
+
+    def paginate_by_cursor(self, queryset, request):
+        page_size = self.get_page_size(request)
+        ordering = self.cursor_ordering
+        self.count = None
+        if self.is_requested(request, self.count_query_param):
+            self.count = self.django_paginator_class(
+                queryset, page_size
+            ).count
+        queryset = queryset.order_by(*ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(get_keyset_filter(
+                ordering, decode_cursor(cursor, ordering, queryset.model)
+            ))
+        page = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_cursor = encode_cursor([
+                getattr(page[-1], field.lstrip('-')) for field in ordering
+            ])
+        return page
+
+    def get_next_cursor_link(self):
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param, self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        # В режиме курсора переход возможен только вперед.
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_cursor_link()),
+            ('previous', None),
+            ('results', data)
+        ]))
+
+
+class MergedCursorPagination(PageLimitPagination):
+    """
+    Курсорная пагинация по нескольким выборкам с одинаковым по смыслу
+    ключом сортировки, например (pub_date, id) рецепта. Из каждой выборки
+    читается не больше страницы после курсора, результаты сливаются.
+    Общее количество объектов не считается.
+    """
+
+    def paginate_sources(self, sources, request):
+        """
+        sources — пары (queryset, ordering). Возвращает ключи страницы
+        в порядке убывания.
+        """
+        self.request = request
+        self.cursor_mode = True
+        self.count = None
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        keys = set()
+        for queryset, ordering in sources:
+            if cursor:
+                queryset = queryset.filter(get_keyset_filter(
+                    ordering, decode_cursor(cursor, ordering, queryset.model)
+                ))
+            keys.update(queryset.order_by(*ordering).values_list(
+                *[field.lstrip('-') for field in ordering]
+            )[:page_size + 1])
+        page = sorted(keys, reverse=True)[:page_size + 1]
+        self.next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_cursor = encode_cursor(list(page[-1]))
+        return page
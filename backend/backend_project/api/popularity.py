@@ -0,0 +1,150 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from app.models import FavoriteRecipe, Recipe, ScoreDecay, ShoppingCart
+
+BATCH_SIZE = 10000
+UPDATE_BATCH_SIZE = 1000
+# Оценки меньше порога обнуляются, чтобы не пересчитывать их при каждом
+# затухании
+MIN_SCORE = 0.01
+# Корзина — намерение приготовить рецепт, она весит больше избранного
+EVENT_WEIGHTS = {
+    FavoriteRecipe: 1.0,
+    ShoppingCart: 2.0,
+}
+DAY = 24 * 60 * 60
+
+
+def get_half_lives():
+    """Периоды полураспада оценок в секундах."""
+    return {
+        'popular_score': settings.POPULAR_HALF_LIFE_DAYS * DAY,
+        'trending_score': settings.TRENDING_HALF_LIFE_DAYS * DAY,
+    }
+
+
+def get_contributions(model, elapsed):
+    """
+    Вклад добавления в избранное или корзину (model) в оценки после
+    затухания за elapsed секунд: {поле оценки: вклад}. Для добавления
+    позже последнего затухания elapsed отрицательно и вклад больше веса.
+    """
+    return {
+        field: EVENT_WEIGHTS[model] * 0.5 ** (elapsed / half_life)
+        for field, half_life in get_half_lives().items()
+    }
+
+
+def get_score_changes(model, events, delta):
+    """
+    Изменение оценок популярности при добавлении (delta > 0) или удалении
+    записей избранного или корзины (model) — аргументы update(). events —
+    пары (recipe_id, created) записей.
+
+    Оценки хранятся на момент последнего затухания: вклад записи — вес,
+    затухший от created до этого момента, и следующее затухание уменьшает
+    его ровно до затухшего от created. Поэтому удаление вычитает ровно
+    то, что добавление прибавило, и оценки совпадают с пересчетом по
+    датам добавления. Ниже нуля оценка не опускается только из-за
+    округления и обнуления малых оценок.
+    """
+    decayed_at = get_decayed_at()
+    contributions = {
+        recipe_id: get_contributions(model, (
+            (decayed_at - created).total_seconds() if decayed_at else 0
+        ))
+        for recipe_id, created in events
+    }
+    changes = {
+        field: Case(
+            *[
+                When(pk=recipe_id, then=Value(values[field]))
+                for recipe_id, values in contributions.items()
+            ],
+            default=Value(0.0),
+            output_field=FloatField()
+        )
+        for field in Recipe.SCORE_FIELDS
+    }
+    if delta > 0:
+        return {field: F(field) + change for field, change in changes.items()}
+    return {
+        field: Greatest(F(field) - change, Value(0.0))
+        for field, change in changes.items()
+    }
+
+
+def rebuild_scores(now, batch_size=UPDATE_BATCH_SIZE):
+    """
+    Пересчет оценок по всем записям избранного и корзин с затуханием от
+    даты добавления до now. Возвращает число рецептов с оценками.
+    """
+    scores = defaultdict(lambda: dict.fromkeys(Recipe.SCORE_FIELDS, 0.0))
+    for model in EVENT_WEIGHTS:
+        for recipe_id, created in model.objects.values_list(
+            'recipe_id', 'created'
+        ).iterator():
+            for field, value in get_contributions(
+                model, (now - created).total_seconds()
+            ).items():
+                scores[recipe_id][field] += value
+    Recipe.objects.update(**dict.fromkeys(Recipe.SCORE_FIELDS, 0))
+    Recipe.objects.bulk_update(
+        [
+            Recipe(pk=pk, **{
+                field: value if value >= MIN_SCORE else 0
+                for field, value in values.items()
+            })
+            for pk, values in scores.items()
+        ],
+        Recipe.SCORE_FIELDS,
+        batch_size=batch_size
+    )
+    return len(scores)
+
+
+def decay_scores(elapsed, batch_size=BATCH_SIZE):
+    """
+    Затухание оценок за elapsed секунд пачками по первичному ключу, чтобы
+    не держать блокировку всей таблицы. Возвращает число измененных строк.
+    """
+    factors = {
+        field: 0.5 ** (elapsed / half_life)
+        for field, half_life in get_half_lives().items()
+    }
+    scored = Recipe.objects.filter(
+        Q(popular_score__gt=0) | Q(trending_score__gt=0)
+    )
+    updated = 0
+    last_pk = 0
+    while True:
+        pks = list(scored.filter(pk__gt=last_pk).order_by('pk').values_list(
+            'pk', flat=True
+        )[:batch_size])
+        if not pks:
+            return updated
+        batch = scored.filter(pk__gte=pks[0], pk__lte=pks[-1])
+        updated += batch.update(**{
+            field: F(field) * Value(factor)
+            for field, factor in factors.items()
+        })
+        for field in factors:
+            batch.filter(
+                **{f'{field}__gt': 0, f'{field}__lt': MIN_SCORE}
+            ).update(**{field: 0})
+        last_pk = pks[-1]
+
+
+def get_decayed_at():
+    """Время последнего затухания оценок или None."""
+    return ScoreDecay.objects.values_list('decayed_at', flat=True).first()
+
+
+def set_decayed_at(moment):
+    ScoreDecay.objects.update_or_create(
+        pk=1, defaults={'decayed_at': moment}
+    )
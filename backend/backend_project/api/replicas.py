@@ -0,0 +1,138 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_KEY = 'replica:pin:{user_id}'
+# Модели, чтение которых можно направить в реплику. Кэш, токены и сессии
+# всегда читаются из основной базы.
+REPLICA_APPS = ('app', 'users')
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+@contextmanager
+def read_from(alias):
+    """Чтение моделей REPLICA_APPS из базы alias внутри блока."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def primary():
+    """
+    Чтение из основной базы. Нужно, когда прочитанное сохраняется в кэш
+    или в базу: данные отстающей реплики иначе пережили бы инвалидацию.
+    """
+    return read_from(None)
+
+
+def pin_to_primary(user):
+    cache.set(
+        PIN_KEY.format(user_id=user.pk), True, settings.REPLICA_PIN_SECONDS
+    )
+
+
+def is_pinned(user):
+    return bool(cache.get(PIN_KEY.format(user_id=user.pk)))
+
+
+def close_unusable_connections():
+    """
+    Проверка постоянных соединений перед запросом: соединение, закрытое
+    сервером БД, закрывается и будет открыто заново при обращении.
+    Соединения после ошибок и старше CONN_MAX_AGE Django закрывает сам,
+    поэтому SELECT 1 отправляется не чаще раза в DB_HEALTH_CHECK_INTERVAL
+    секунд на соединение.
+    """
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        checked = getattr(connection, 'health_checked', None)
+        if checked is None or checked[0] is not connection.connection:
+            # Соединение открыто в прошлом запросе и еще не проверялось
+            connection.health_checked = (connection.connection, now)
+        elif now - checked[1] >= settings.DB_HEALTH_CHECK_INTERVAL:
+            if connection.is_usable():
+                connection.health_checked = (connection.connection, now)
+            else:
+                connection.close()
+
+
+class ReplicaRouter:
+    """
+    Чтение из реплики, выбранной для текущего запроса ReplicaReadMixin.
+    Запись и миграции всегда идут в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in REPLICA_APPS:
+            return _read_alias.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaReadMixin:
+    """
+    Безопасные запросы вью читают из случайной реплики. Пользователь,
+    недавно изменявший данные, читает из основной базы, чтобы сразу
+    увидеть свои изменения.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and not (request.user.is_authenticated and is_pinned(request.user))
+        ):
+            self.replica = read_from(random.choice(settings.DATABASE_REPLICAS))
+            self.replica.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        replica = getattr(self, 'replica', None)
+        if replica is not None:
+            self.replica = None
+            replica.__exit__(None, None, None)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaPinMiddleware:
+    """
+    После успешного изменяющего запроса пользователь на
+    REPLICA_PIN_SECONDS секунд закрепляется за основной базой.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and user is not None and user.is_authenticated
+        ):
+            pin_to_primary(user)
+        return response
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from .catalog import (
+    INGREDIENTS_CATALOG, RECIPES_NAMESPACE, TAGS_CATALOG, get_versions
+)
+from .replicas import primary
+
+RESPONSE_CACHE_KEY = 'response:{digest}'
+STATS_KEY = 'response:stats:{event}'
+CACHE_HEADER = 'X-Cache'
+HIT = 'hit'
+MISS = 'miss'
+
+
+def normalize_query(query_params):
+    """
+    Параметры запроса без пустых значений, отсортированные по имени и
+    значениям: ?tags=b&tags=a и ?tags=a&tags=b дают один ключ.
+    """
+    return sorted(
+        (name, sorted(value for value in values if value))
+        for name, values in query_params.lists()
+        if any(values)
+    )
+
+
+def get_response_cache_key(request, versions):
+    digest = hashlib.md5(json.dumps([
+        request.get_host(), request.path, normalize_query(
+            request.query_params
+        ), versions
+    ]).encode()).hexdigest()
+    return RESPONSE_CACHE_KEY.format(digest=digest)
+
+
+class ResponseCacheStats:
+    """
+    Счетчики попаданий и промахов. Копятся в памяти процесса и
+    сбрасываются в общий кэш не чаще, чем раз в
+    RESPONSE_CACHE_STATS_INTERVAL секунд.
+    """
+
+    events = (HIT, MISS)
+
+    def __init__(self):
+        self.pending = Counter()
+        self.flushed = time.monotonic()
+
+    def count(self, event):
+        self.pending[event] += 1
+        now = time.monotonic()
+        if now - self.flushed > settings.RESPONSE_CACHE_STATS_INTERVAL:
+            self.flush()
+            self.flushed = now
+
+    def flush(self):
+        pending, self.pending = self.pending, Counter()
+        for event, value in pending.items():
+            key = STATS_KEY.format(event=event)
+            cache.add(key, 0, None)
+            cache.incr(key, value)
+
+    def get(self):
+        """Накопленные всеми процессами значения счетчиков."""
+        values = cache.get_many(
+            [STATS_KEY.format(event=event) for event in self.events]
+        )
+        return {
+            event: values.get(STATS_KEY.format(event=event), 0)
+            for event in self.events
+        }
+
+
+response_cache_stats = ResponseCacheStats()
+
+
+class ResponseCacheMixin:
+    """
+    Общий кэш ответов для анонимных GET-запросов.
+
+    Ключ строится по нормализованным параметрам запроса и версиям
+    пространств имен, от которых зависит ответ. Запись рецепта, тега или
+    ингредиента меняет версию, поэтому устаревшие ответы не читаются,
+    а перебирать ключи кэша не нужно.
+    """
+
+    response_cache_namespaces = (
+        RECIPES_NAMESPACE, TAGS_CATALOG, INGREDIENTS_CATALOG
+    )
+
+    def cached_response(self, build, request, *args, **kwargs):
+        if not request.user.is_anonymous or request.method != 'GET':
+            return build(request, *args, **kwargs)
+        versions = get_versions(self.response_cache_namespaces)
+        key = get_response_cache_key(request, sorted(versions.items()))
+        data = cache.get(key)
+        if data is not None:
+            response_cache_stats.count(HIT)
+            response = Response(data)
+            response[CACHE_HEADER] = HIT
+            return response
+        response_cache_stats.count(MISS)
+        # Ответ, собранный по отстающей реплике, остался бы в кэше под
+        # новой версией
+        with primary():
+            response = build(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        response[CACHE_HEADER] = MISS
+        return response
@@ -0,0 +1,150 @@
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import (
+    Case, Count, Exists, F, IntegerField, OuterRef, Q, Subquery, Value, When
+)
+from django.db.models.functions import Coalesce, Lower, Replace
+
+from .catalog import INGREDIENTS_CATALOG, register_catalog
+from .serializers import IngredientUnitSerializer
+from app.models import (
+    SEARCH_CONFIG, USE_POSTGRESQL, Ingredient, RecipeSearchTerm,
+    get_search_terms
+)
+
+MAX_SEARCH_TERMS = 8
+
+
+def normalize(text):
+    """Приведение строки к виду для поиска: регистр, «ё» и пробелы."""
+    return text.casefold().replace('ё', 'е').strip()
+
+
+def normalized_name():
+    """
+    Название ингредиента, приведенное как в normalize(), в запросе к БД.
+    Выражение совпадает с выражением триграммного индекса из миграции
+    0017_ingredient_search_name_trgm.
+    """
+    return Replace(Lower('name'), Value('ё'), Value('е'))
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Названия хранятся отсортированными, поэтому совпадения по префиксу
+    находятся бинарным поиском, а совпадения по подстроке добиваются
+    последовательным просмотром только до заполнения лимита.
+    """
+
+    def __init__(self, ingredients):
+        self.ingredients = sorted(
+            ingredients, key=lambda ingredient: normalize(ingredient.name)
+        )
+        self.keys = [
+            normalize(ingredient.name) for ingredient in self.ingredients
+        ]
+
+    def search(self, query, limit):
+        query = normalize(query)
+        start = bisect_left(self.keys, query)
+        end = start
+        while (
+            end < len(self.keys) and end - start < limit
+            and self.keys[end].startswith(query)
+        ):
+            end += 1
+        result = self.ingredients[start:end]
+        for key, ingredient in zip(self.keys, self.ingredients):
+            if len(result) >= limit:
+                break
+            if query in key and not key.startswith(query):
+                result.append(ingredient)
+        return result
+
+
+def load_ingredients():
+    ingredients = list(Ingredient.objects.all())
+    serialized = IngredientUnitSerializer(ingredients, many=True).data
+    return {
+        'list': list(serialized),
+        'by_id': {item['id']: item for item in serialized},
+        'index': IngredientIndex(ingredients),
+    }
+
+
+ingredients_catalog = register_catalog(INGREDIENTS_CATALOG, load_ingredients)
+
+
+def get_ingredient_index():
+    return ingredients_catalog.get()[1]['index']
+
+
+def search_ingredients(query, limit=None):
+    """
+    Автодополнение ингредиентов: сначала совпадения по началу названия,
+    затем по подстроке, не больше limit результатов.
+
+    На PostgreSQL поиск выполняется по триграммному GIN-индексу,
+    на остальных СУБД — по индексу в памяти процесса. Название и запрос
+    в обоих случаях приводятся одинаково: «ёжик» находится по «ежик».
+    """
+    limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+    if connections[Ingredient.objects.db].vendor != 'postgresql':
+        return get_ingredient_index().search(query, limit)
+    query = normalize(query)
+    return list(Ingredient.objects.annotate(
+        search_name=normalized_name()
+    ).filter(search_name__contains=query).annotate(
+        is_substring=Case(
+            When(search_name__startswith=query, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    ).order_by('is_substring', 'name')[:limit])
+
+
+def match_term_prefix(term):
+    # Диапазон вместо LIKE, чтобы поиск по префиксу шел по индексу
+    # на любой СУБД
+    return Q(term__gte=term, term__lt=term + '\uffff')
+
+
+def search_recipes(queryset, query):
+    """
+    Полнотекстовый поиск рецептов по названию и описанию, результаты
+    отсортированы по релевантности.
+
+    На PostgreSQL используется tsvector с GIN-индексом, совпадения в
+    названии весят больше, чем в описании. На остальных СУБД рецепт
+    должен содержать слова, начинающиеся с каждого слова запроса, выше
+    рецепты с совпадениями в названии.
+    """
+    if USE_POSTGRESQL:
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-search_rank', '-pub_date', '-id')
+    terms = sorted(get_search_terms(query))[:MAX_SEARCH_TERMS]
+    if not terms:
+        return queryset.none()
+    matches = Q()
+    for position, term in enumerate(terms):
+        matches |= match_term_prefix(term)
+        queryset = queryset.annotate(**{
+            f'search_term_{position}': Exists(RecipeSearchTerm.objects.filter(
+                match_term_prefix(term), recipe=OuterRef('pk')
+            ))
+        }).filter(**{f'search_term_{position}': True})
+    name_matches = RecipeSearchTerm.objects.filter(
+        matches, recipe=OuterRef('pk'), in_name=True
+    ).order_by().values('recipe').annotate(
+        count=Count('pk')
+    ).values('count')
+    return queryset.annotate(search_rank=Coalesce(
+        Subquery(name_matches, output_field=IntegerField()), 0
+    )).order_by('-search_rank', '-pub_date', '-id')
@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.contrib.auth import password_validation
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
@@ -7,8 +9,11 @@ from rest_framework.relations import PrimaryKeyRelatedField
 
 from app.models import (
     FavoriteRecipe, Ingredient, Recipe, RecipeIngredient,
-    ShoppingCart, Subscription, Tag, User
+    ShoppingCart, ShoppingListExport, Subscription, Tag, User
 )
+from .images import get_image_renditions, schedule_renditions
+from .metrics import TimedSerializerMixin
+from .utils import bulk_maintenance, change_shopping_lists
 
 
 WRONG_CURRENT_PASSWORD = 'Current password is wrong'
@@ -16,10 +21,11 @@ CANNOT_USER_ME_AS_USERNAME = 'You cannot use "me" as username'
 NOT_UNIQUE_INGREDS = 'Ingredient {ingredient} in a recipe should be unique'
 NOT_POSITIVE_COOKING_TIME = 'Cooking time should be more than 0 minutes'
 NOT_POSITIVE_AMOUNT = 'Amount of {ingredient} should be more 0'
+INGREDIENT_NOT_FOUND = 'Ingredient does not exist'
 
 
 # Сериализаторы функционала, связанного с пользователями
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор кастомной модели пользователя."""
 
     password = serializers.CharField(write_only=True)
@@ -57,6 +63,8 @@ class UserSerializer(serializers.ModelSerializer):
         return super(UserSerializer, self).validate(attrs)
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request', None)
         if not request:
             return False
@@ -94,7 +102,7 @@ class ChangePasswordSerializer(serializers.Serializer):
 
 # Сериализаторы функционала, связанного с рецептами
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор модели тегов."""
 
     class Meta:
@@ -102,7 +110,9 @@ class TagSerializer(serializers.ModelSerializer):
         model = Tag
 
 
-class IngredientUnitSerializer(serializers.ModelSerializer):
+class IngredientUnitSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     """Сериализатор модели ингредиентов и единиц измерения"""
 
     class Meta:
@@ -133,7 +143,9 @@ class RecipeIngredientGetSerializer(serializers.ModelSerializer):
 class RecipeIngredientPostSerializer(serializers.ModelSerializer):
     """Сериализатор модели-связи для создания записей ингредиент-рецепт"""
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    # Ингредиенты всего рецепта загружаются одним запросом в
+    # RecipePostSerializer.validate, а не по одному на каждую позицию.
+    id = serializers.IntegerField(source='ingredient_id')
     amount = serializers.IntegerField()
 
     class Meta:
@@ -141,7 +153,7 @@ class RecipeIngredientPostSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeGetSerializer(serializers.ModelSerializer):
+class RecipeGetSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для безопасных методов модели рецептов"""
 
     tags = TagSerializer(many=True, read_only=True, source='tag')
@@ -150,17 +162,27 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         many=True, read_only=True, source='pieces'
     )
     image = serializers.SerializerMethodField()
+    image_renditions = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited', 'name',
-            'image', 'text', 'cooking_time', 'is_in_shopping_cart'
+            'image', 'image_renditions', 'text', 'cooking_time',
+            'is_in_shopping_cart'
         )
         model = Recipe
 
+    def to_representation(self, instance):
+        # Аннотация из RecipeViewSet передается вложенному автору.
+        if hasattr(instance, 'is_subscribed_to_author'):
+            instance.author.is_subscribed = instance.is_subscribed_to_author
+        return super().to_representation(instance)
+
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request', None)
         if not request:
             return False
@@ -171,6 +193,8 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         ).exists()
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request', None)
         if not request:
             return False
@@ -183,6 +207,9 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     def get_image(self, obj):
         return '/media/' + str(obj.image)
 
+    def get_image_renditions(self, obj):
+        return get_image_renditions(obj)
+
 
 class RecipePostSerializer(serializers.ModelSerializer):
     """Сериализатор для небезопасных методов модели рецептов"""
@@ -201,91 +228,136 @@ class RecipePostSerializer(serializers.ModelSerializer):
         )
         model = Recipe
 
-    def add_ingredients(self, recipe, ingredients):
+    def add_ingredients(self, recipe, pieces):
         return RecipeIngredient.objects.bulk_create([
             RecipeIngredient(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(pk=ingredient['id']),
-                amount=ingredient['amount'],
-            ) for ingredient in ingredients
+                ingredient=piece['ingredient'],
+                amount=piece['amount'],
+            ) for piece in pieces
         ])
 
-    def create(self, validated_data):
+    def update_ingredients(self, recipe, pieces):
+        """
+        Приведение ингредиентов рецепта к новому составу: добавляются
+        новые позиции, меняется количество измененных, удаляются лишние.
+        Возвращает изменения количеств {ingredient_id: разница}.
+        """
+        current = {piece.ingredient_id: piece for piece in recipe.pieces.all()}
+        amounts = {piece['ingredient'].id: piece['amount'] for piece in pieces}
+        deltas = {
+            pk: amounts.get(pk, 0) - (
+                current[pk].amount if pk in current else 0
+            ) for pk in set(current) | set(amounts)
+        }
+        created = [
+            piece for piece in pieces
+            if piece['ingredient'].id not in current
+        ]
+        changed = []
+        for pk, piece in current.items():
+            if pk in amounts and amounts[pk] != piece.amount:
+                piece.amount = amounts[pk]
+                changed.append(piece)
+        removed = [pk for pk in current if pk not in amounts]
+        self.add_ingredients(recipe, created)
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if removed:
+            with bulk_maintenance():
+                recipe.pieces.filter(ingredient_id__in=removed).delete()
+        return deltas
 
-        # убираем из validated_data список ингредиентов вида
-        # OrderedDict([
-        #   ('id', <Ingredient: абрикосовое варенье, г>), ('amount', 34)]), ..
-        # ])
-        validated_data.pop('pieces')
+    def create(self, validated_data):
+        pieces = validated_data.pop('pieces')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tag.set(tags)
-
-        # получаем список ингредиентов вида
-        # [{'id': 1, 'amount': '34'}, ..]
-        # для дальнейшего создания объектов через bulk_create
-        ingredients = self.context['request'].data['ingredients']
-        self.add_ingredients(recipe, ingredients)
+        self.add_ingredients(recipe, pieces)
+        schedule_renditions(recipe.pk)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        validated_data.pop('pieces')
+        pieces = validated_data.pop('pieces')
         tags = validated_data.pop('tags')
+        if 'image' in validated_data:
+            instance.image_key = ''
+            schedule_renditions(instance.pk)
         super().update(instance, validated_data)
-        instance.ingredient.clear()
         instance.tag.set(tags)
-        ingredients = self.context['request'].data['ingredients']
-        self.add_ingredients(instance, ingredients)
+        deltas = self.update_ingredients(instance, pieces)
+        # Корзины с этим рецептом меняются на разницу в составе.
+        change_shopping_lists(
+            instance.shopping_recipe.values_list('user_id', flat=True),
+            deltas
+        )
         return instance
 
     def validate(self, attrs):
-        ingredients_list = []
-        for ingredient_piece in attrs.get('pieces'):
-            ingredient, amount_info = list(ingredient_piece.items())
-            name = ingredient[1].name
-            amount = int(amount_info[1])
-            if ingredient in ingredients_list:
+        pieces = attrs.get('pieces')
+        ingredients = Ingredient.objects.in_bulk(
+            [piece['ingredient_id'] for piece in pieces]
+        )
+        seen = set()
+        for piece in pieces:
+            ingredient = ingredients.get(piece.pop('ingredient_id'))
+            if ingredient is None:
+                raise serializers.ValidationError(INGREDIENT_NOT_FOUND)
+            if ingredient.id in seen:
                 raise serializers.ValidationError(
-                    NOT_UNIQUE_INGREDS.format(ingredient=name)
+                    NOT_UNIQUE_INGREDS.format(ingredient=ingredient.name)
                 )
-            ingredients_list.append(ingredient)
-            if amount <= 0:
+            seen.add(ingredient.id)
+            if piece['amount'] <= 0:
                 raise serializers.ValidationError(
-                    NOT_POSITIVE_AMOUNT.format(ingredient=name)
+                    NOT_POSITIVE_AMOUNT.format(ingredient=ingredient.name)
                 )
+            piece['ingredient'] = ingredient
         if int(attrs.get('cooking_time')) <= 0:
             raise serializers.ValidationError(NOT_POSITIVE_COOKING_TIME)
         return attrs
 
 
 # Сериализаторы подписок
-class RecipeNestedSerializer(serializers.ModelSerializer):
+class RecipeNestedSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
 
     image = serializers.SerializerMethodField()
+    image_renditions = serializers.SerializerMethodField()
 
     def get_image(self, obj):
         return '/media/' + str(obj.image)
 
+    def get_image_renditions(self, obj):
+        return get_image_renditions(obj)
+
     class Meta:
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
         model = Recipe
 
 
-class SubscriptionGetSerializer(serializers.ModelSerializer):
+class SubscriptionGetSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     """Сериализатор подписок."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count', read_only=True
-    )
     is_subscribed = serializers.SerializerMethodField()
 
     def get_recipes(self, obj):
-        queryset = obj.recipes.all()[:self.context.get('recipes_limit', None)]
+        if 'recipes' in self.context:
+            queryset = self.context['recipes'].get(obj.id, [])
+        else:
+            queryset = obj.recipes.all()[
+                :self.context.get('recipes_limit', None)
+            ]
         serializer = RecipeNestedSerializer(queryset, many=True)
         return serializer.data
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request', None)
         if not request:
             return False
@@ -300,3 +372,33 @@ class SubscriptionGetSerializer(serializers.ModelSerializer):
             'is_subscribed', 'recipes', 'recipes_count'
         )
         model = User
+
+
+# Сериализатор выгрузок списка покупок
+class ShoppingListExportSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
+    """Сериализатор заданий на выгрузку списка покупок."""
+
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        fields = ('id', 'status', 'created', 'download')
+        model = ShoppingListExport
+
+    def get_download(self, obj):
+        if obj.status != ShoppingListExport.DONE:
+            return None
+        return (
+            f'/api/recipes/download_shopping_cart/exports/{obj.pk}/file/'
+        )
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Идентификаторы рецептов для массовых операций."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_MAX
+    )
@@ -0,0 +1,235 @@
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_init, post_save, pre_save
+)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token
+from .catalog import (
+    INGREDIENTS_CATALOG, RECIPES_NAMESPACE, TAGS_CATALOG,
+    bump_catalog_version, bump_version
+)
+from .feed import followers_changed
+from .replicas import close_unusable_connections
+from .snapshots import drop_snapshots
+from .utils import (
+    change_counter, change_recipe_counters, change_shopping_list_by_recipes,
+    change_shopping_lists_by_piece, in_bulk_maintenance
+)
+from app.models import (
+    FavoriteRecipe, Ingredient, Recipe, RecipeIngredient, RecipeTag,
+    ShoppingCart, Subscription, Tag, User
+)
+
+# Поля, от которых зависят счетчики и списки покупок: изменение любого из
+# них, например в админке, снимает вклад старой записи и добавляет новый
+MAINTAINED_FIELDS = {
+    FavoriteRecipe: ('user_id', 'recipe_id', 'created'),
+    ShoppingCart: ('user_id', 'recipe_id', 'created'),
+    RecipeIngredient: ('recipe_id', 'ingredient_id', 'amount'),
+    Subscription: ('user_id', 'author_id'),
+    Recipe: ('author_id',),
+}
+# Поля пользователя, от которых зависит аутентификация по токену
+AUTH_FIELDS = frozenset(['password', 'is_active'])
+
+
+def invalidate_recipe_responses():
+    # Версия меняется после фиксации транзакции, иначе параллельный
+    # запрос успеет закэшировать старые данные под новой версией.
+    transaction.on_commit(lambda: bump_version(RECIPES_NAMESPACE))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tags_catalog(**kwargs):
+    # Как и для рецептов: до фиксации другие процессы перечитали бы
+    # справочник без изменения и закэшировали его под новой версией.
+    transaction.on_commit(lambda: bump_catalog_version(TAGS_CATALOG))
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredients_catalog(**kwargs):
+    transaction.on_commit(
+        lambda: bump_catalog_version(INGREDIENTS_CATALOG)
+    )
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe(**kwargs):
+    invalidate_recipe_responses()
+
+
+@receiver(post_save, sender=Recipe)
+def drop_recipe_snapshot(instance, **kwargs):
+    drop_snapshots(recipe=instance)
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+@receiver([post_save, post_delete], sender=RecipeTag)
+def drop_piece_snapshot(instance, **kwargs):
+    drop_snapshots(recipe_id=instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tag.through)
+def drop_tagged_snapshots(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        drop_snapshots(recipe=instance)
+    elif action == 'pre_clear':
+        drop_snapshots(recipe__tag=instance)
+    else:
+        drop_snapshots(recipe__in=pk_set)
+
+
+@receiver(post_save, sender=Tag)
+def drop_tag_snapshots(instance, created, **kwargs):
+    if not created:
+        drop_snapshots(recipe__tag=instance)
+
+
+@receiver(post_save, sender=Ingredient)
+def drop_ingredient_snapshots(instance, created, **kwargs):
+    if not created:
+        drop_snapshots(recipe__pieces__ingredient=instance)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(instance, created, update_fields, **kwargs):
+    # Данные автора входят в ответы с рецептами
+    if not created and update_fields != frozenset(['last_login']):
+        invalidate_recipe_responses()
+        drop_snapshots(recipe__author=instance)
+
+
+def get_auth_state(instance):
+    # Отложенные поля не читаются из БД
+    return {field: instance.__dict__.get(field) for field in AUTH_FIELDS}
+
+
+@receiver(post_init, sender=User)
+def remember_auth_state(instance, **kwargs):
+    instance._auth_state = get_auth_state(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, created, update_fields, **kwargs):
+    """
+    Токены пользователя сбрасываются, только если сменились пароль или
+    активность: остальные сохранения, например last_login при входе, не
+    обращаются к таблице токенов.
+    """
+    if update_fields is not None and not AUTH_FIELDS & update_fields:
+        return
+    state = get_auth_state(instance)
+    previous, instance._auth_state = instance._auth_state, state
+    if created or previous == state:
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+        'key', flat=True
+    ):
+        invalidate_token(key)
+
+
+def apply_recipe_event(model, state, delta):
+    change_recipe_counters(
+        model, [(state['recipe_id'], state['created'])], delta
+    )
+    if model is ShoppingCart:
+        change_shopping_list_by_recipes(
+            state['user_id'], [state['recipe_id']], delta
+        )
+
+
+def apply_piece(model, state, delta):
+    change_shopping_lists_by_piece(
+        state['recipe_id'], state['ingredient_id'], delta * state['amount']
+    )
+
+
+def apply_subscription(model, state, delta):
+    change_counter(
+        User.objects.filter(pk=state['author_id']), 'followers_count', delta
+    )
+    followers_changed(state['author_id'], delta)
+
+
+def apply_recipe(model, state, delta):
+    change_counter(
+        User.objects.filter(pk=state['author_id']), 'recipes_count', delta
+    )
+
+
+MAINTENANCE = {
+    FavoriteRecipe: apply_recipe_event,
+    ShoppingCart: apply_recipe_event,
+    RecipeIngredient: apply_piece,
+    Subscription: apply_subscription,
+    Recipe: apply_recipe,
+}
+
+
+def get_state(sender, instance):
+    return {
+        field: getattr(instance, field)
+        for field in MAINTAINED_FIELDS[sender]
+    }
+
+
+def remember_state(sender, instance, raw, **kwargs):
+    # Состояние до изменения существующей записи
+    instance._maintained_state = None if raw or instance._state.adding else (
+        sender.objects.filter(pk=instance.pk).values(
+            *MAINTAINED_FIELDS[sender]
+        ).first()
+    )
+
+
+def maintain_saved(sender, instance, created, raw, **kwargs):
+    """
+    Счетчики и списки покупок при сохранении отдельного объекта: в том
+    числе из админки. Пакетные операции API поддерживают их сами.
+    """
+    if raw or in_bulk_maintenance():
+        return
+    state = get_state(sender, instance)
+    previous = getattr(instance, '_maintained_state', None)
+    if created:
+        MAINTENANCE[sender](sender, state, 1)
+    elif previous and previous != state:
+        MAINTENANCE[sender](sender, previous, -1)
+        MAINTENANCE[sender](sender, state, 1)
+
+
+def maintain_deleted(sender, instance, **kwargs):
+    """
+    Счетчики и списки покупок при удалении, в том числе каскадном. Вклад
+    пары «корзина — ингредиент рецепта» снимается один раз: обработчик
+    модели, удаленной первой, еще видит строки второй, а обработчик второй
+    уже не видит строк первой.
+    """
+    if in_bulk_maintenance():
+        return
+    MAINTENANCE[sender](sender, get_state(sender, instance), -1)
+
+
+for model in MAINTENANCE:
+    pre_save.connect(remember_state, sender=model)
+    post_save.connect(maintain_saved, sender=model)
+    post_delete.connect(maintain_deleted, sender=model)
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    # В Django 2.2 нет CONN_HEALTH_CHECKS, постоянные соединения
+    # проверяются перед запросом раз в DB_HEALTH_CHECK_INTERVAL секунд
+    if settings.DB_HEALTH_CHECKS:
+        close_unusable_connections()
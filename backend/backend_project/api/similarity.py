@@ -0,0 +1,319 @@
+import heapq
+import logging
+import math
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q
+
+from app.models import Recipe, RecipeIngredient, RecipeTag, SimilarRecipe
+
+INGREDIENT = 'ingredient'
+TAG = 'tag'
+FEATURE_SOURCES = (
+    (INGREDIENT, RecipeIngredient, 'ingredient_id'),
+    (TAG, RecipeTag, 'tag_id'),
+)
+# Теги — крупные категории, общий тег весит меньше общего ингредиента
+TAG_WEIGHT = 0.5
+# Признаки, которые есть больше чем у CANDIDATE_SHARE рецептов, например
+# соль или популярный тег, не порождают кандидатов в соседи, но
+# учитываются в сходстве
+CANDIDATE_SHARE = 0.05
+MIN_CANDIDATE_RECIPES = 100
+# Во сколько раз больше кандидатов, чем нужно соседей, пересчитывается
+# точно после приближенной оценки по редким признакам
+RERANK_FACTOR = 5
+# Пачки идентификаторов в условиях IN: не больше 999 параметров на SQLite
+BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def load_features(recipe_ids=None):
+    """
+    Признаки рецептов — ингредиенты и теги: {recipe_id: {(вид, id)}}.
+    recipe_ids — выборка идентификаторов рецептов, по умолчанию все.
+    """
+    features = defaultdict(set)
+    for kind, model, field in FEATURE_SOURCES:
+        queryset = model.objects.order_by()
+        if recipe_ids is not None:
+            queryset = queryset.filter(recipe_id__in=recipe_ids)
+        for recipe_id, pk in queryset.values_list(
+            'recipe_id', field
+        ).iterator():
+            features[recipe_id].add((kind, pk))
+    return features
+
+
+def count_features(features):
+    """Число рецептов с каждым признаком по загруженным признакам."""
+    return Counter(
+        feature
+        for recipe_features in features.values()
+        for feature in recipe_features
+    )
+
+
+def load_frequencies(features):
+    """Число рецептов с каждым из признаков features по всей базе."""
+    frequencies = {}
+    for kind, model, field in FEATURE_SOURCES:
+        ids = [pk for feature_kind, pk in features if feature_kind == kind]
+        for chunk in chunks(ids):
+            frequencies.update(
+                ((kind, pk), count)
+                for pk, count in model.objects.filter(
+                    **{f'{field}__in': chunk}
+                ).order_by().values(field).annotate(
+                    count=Count('pk')
+                ).values_list(field, 'count')
+            )
+    return frequencies
+
+
+def get_candidate_features(features, frequencies, total):
+    """
+    Признаки рецепта, по которым ищутся кандидаты в соседи: редкие, а если
+    их нет — самый редкий из имеющихся.
+    """
+    limit = max(MIN_CANDIDATE_RECIPES, CANDIDATE_SHARE * total)
+    features = sorted(features, key=lambda feature: (
+        frequencies[feature], feature
+    ))
+    return [
+        feature for feature in features if frequencies[feature] <= limit
+    ] or features[:1]
+
+
+class SimilarityIndex:
+    """
+    Разреженная матрица рецепт × признак с весами IDF и косинусное
+    сходство ее строк. Сходство с кандидатами сначала оценивается по
+    обратному индексу редких признаков, затем лучшие кандидаты
+    пересчитываются точно по всем признакам.
+    """
+
+    def __init__(self, features, frequencies, total):
+        self.features = features
+        self.frequencies = frequencies
+        self.total = total
+        # Квадраты весов: из них складываются скалярные произведения
+        self.weights = {
+            feature: (
+                (math.log((1 + total) / (1 + count)) + 1)
+                * (TAG_WEIGHT if feature[0] == TAG else 1)
+            ) ** 2
+            for feature, count in frequencies.items()
+        }
+        self.norms = {
+            pk: math.sqrt(sum(self.weights[feature] for feature in items))
+            for pk, items in features.items()
+        }
+        self.postings = defaultdict(list)
+        for pk, items in features.items():
+            for feature in items:
+                self.postings[feature].append(pk)
+
+    def score(self, first, second):
+        shared = self.features[first] & self.features[second]
+        return sum(self.weights[feature] for feature in shared) / (
+            self.norms[first] * self.norms[second]
+        )
+
+    def get_scores(self, pk, count=None):
+        """
+        Сходство рецепта pk с кандидатами {recipe_id: score}. С count
+        точно пересчитываются только count * RERANK_FACTOR лучших.
+        """
+        partial = defaultdict(float)
+        for feature in get_candidate_features(
+            self.features[pk], self.frequencies, self.total
+        ):
+            weight = self.weights[feature]
+            for other in self.postings[feature]:
+                partial[other] += weight
+        partial.pop(pk, None)
+        candidates = partial if count is None else heapq.nlargest(
+            count * RERANK_FACTOR, partial, key=partial.get
+        )
+        return {other: self.score(pk, other) for other in candidates}
+
+    def get_neighbors(self, pk, count):
+        """count соседей рецепта pk: пары (recipe_id, score)."""
+        return top(self.get_scores(pk, count), count)
+
+
+def top(scores, count):
+    return heapq.nlargest(
+        count, scores.items(), key=lambda item: (item[1], -item[0])
+    )
+
+
+def rebuild_similar_recipes(count=None, batch_size=BATCH_SIZE):
+    """
+    Полный пересчет похожих рецептов. Пачки рецептов записываются в
+    отдельных транзакциях, чтение не прерывается на время пересчета.
+    Возвращает число рецептов с признаками и число записанных соседей.
+    """
+    count = count or settings.SIMILAR_RECIPES_COUNT
+    features = load_features()
+    index = SimilarityIndex(
+        features, count_features(features), Recipe.objects.count()
+    )
+    created = 0
+    for batch in chunks(sorted(features), batch_size):
+        rows = [
+            SimilarRecipe(recipe_id=pk, similar_id=other, score=score)
+            for pk in batch
+            for other, score in index.get_neighbors(pk, count)
+        ]
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=batch).delete()
+            SimilarRecipe.objects.bulk_create(rows)
+        created += len(rows)
+    # Рецепты, у которых не осталось ингредиентов и тегов
+    SimilarRecipe.objects.filter(
+        recipe__pieces__isnull=True, recipe__tags__isnull=True
+    ).delete()
+    return len(features), created
+
+
+def trim_neighbors(recipe_ids, count):
+    """Удаление худших соседей сверх count у рецептов recipe_ids."""
+    for batch in chunks(recipe_ids):
+        neighbors = defaultdict(list)
+        for pk, recipe_id, similar_id, score in SimilarRecipe.objects.filter(
+            recipe_id__in=batch
+        ).values_list('pk', 'recipe_id', 'similar_id', 'score'):
+            neighbors[recipe_id].append((score, -similar_id, pk))
+        extra = [
+            pk
+            for rows in neighbors.values()
+            for _, _, pk in sorted(rows, reverse=True)[count:]
+        ]
+        SimilarRecipe.objects.filter(pk__in=extra).delete()
+
+
+def score_candidates(recipe_id, total):
+    """
+    Сходство рецепта recipe_id с рецептами с общими редкими признаками:
+    {recipe_id: score} и подзапрос идентификаторов этих рецептов.
+    Загружаются только они, частоты признаков берутся по всей базе.
+    """
+    own = load_features([recipe_id])
+    if not own:
+        return {}, Recipe.objects.none().values('pk')
+    frequencies = load_frequencies(own[recipe_id])
+    candidate_features = get_candidate_features(
+        own[recipe_id], frequencies, total
+    )
+    candidates = Recipe.objects.filter(Q(*[
+        Q(pk__in=model.objects.filter(**{f'{field}__in': [
+            pk for feature_kind, pk in candidate_features
+            if feature_kind == kind
+        ]}).values('recipe_id'))
+        for kind, model, field in FEATURE_SOURCES
+    ], _connector=Q.OR)).values('pk')
+    features = load_features(candidates)
+    frequencies.update(load_frequencies(
+        set().union(*features.values()) - frequencies.keys()
+    ))
+    scores = SimilarityIndex(features, frequencies, total).get_scores(
+        recipe_id
+    )
+    return scores, candidates
+
+
+def replace_neighbors(recipe_id, scores, count):
+    SimilarRecipe.objects.filter(recipe_id=recipe_id).delete()
+    SimilarRecipe.objects.bulk_create([
+        SimilarRecipe(recipe_id=recipe_id, similar_id=other, score=score)
+        for other, score in top(scores, count)
+    ])
+
+
+@transaction.atomic
+def update_similar_recipes(recipe_id, count=None):
+    """
+    Пересчет соседей рецепта recipe_id после изменения и его места в
+    списках соседей других рецептов. Списки, где сходство с ним
+    уменьшилось, пересчитываются целиком: их место может занять рецепт,
+    который раньше в них не попал.
+    """
+    count = count or settings.SIMILAR_RECIPES_COUNT
+    previous = dict(SimilarRecipe.objects.filter(
+        similar_id=recipe_id
+    ).values_list('recipe_id', 'score'))
+    SimilarRecipe.objects.filter(
+        Q(recipe_id=recipe_id) | Q(similar_id=recipe_id)
+    ).delete()
+    total = Recipe.objects.count()
+    scores, candidates = score_candidates(recipe_id, total)
+    replace_neighbors(recipe_id, scores, count)
+    degraded = {
+        other for other, score in previous.items()
+        if scores.get(other, 0) < score
+    }
+    for other in degraded:
+        replace_neighbors(other, score_candidates(other, total)[0], count)
+    # Рецепт попадает в остальные списки тех, у кого меньше count соседей
+    # или худший сосед хуже него
+    lists = {
+        pk: (size, worst)
+        for pk, size, worst in SimilarRecipe.objects.filter(
+            recipe_id__in=candidates
+        ).values('recipe_id').annotate(
+            size=Count('pk'), worst=Min('score')
+        ).values_list('recipe_id', 'size', 'worst').order_by()
+    }
+    added = [
+        other for other, score in scores.items()
+        if score > 0 and other not in degraded and (
+            lists.get(other, (0, 0))[0] < count
+            or score > lists[other][1]
+        )
+    ]
+    SimilarRecipe.objects.bulk_create([
+        SimilarRecipe(recipe_id=other, similar_id=recipe_id,
+                      score=scores[other])
+        for other in added
+    ])
+    trim_neighbors(
+        [other for other in added if other in lists], count
+    )
+
+
+def update_in_background(recipe_id):
+    try:
+        update_similar_recipes(recipe_id)
+    except Exception:
+        logger.exception(
+            'Similar recipes update failed for recipe %s', recipe_id
+        )
+    finally:
+        connection.close()
+
+
+def schedule_similar_recipes(recipe_id):
+    """
+    Пересчет похожих рецептов в фоновом потоке после фиксации транзакции.
+    Один поток, чтобы обновления не пересекались.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1)
+    transaction.on_commit(
+        lambda: _executor.submit(update_in_background, recipe_id)
+    )
@@ -0,0 +1,176 @@
+import json
+
+from django.db import transaction
+from django.db.models import F, Prefetch
+from rest_framework import serializers
+
+from .images import get_image_renditions
+from .metrics import TimedSerializerMixin
+from .replicas import primary
+from .serializers import RecipeGetSerializer
+from app.models import Recipe, RecipeIngredient, RecipeSnapshot
+
+BATCH_SIZE = 500
+# Поля, которые вычисляются при чтении: флаги пользователя и уменьшенные
+# копии изображения, ключ которых записывается фоновой обработкой.
+USER_FIELDS = ('is_favorited', 'is_in_shopping_cart')
+READ_FIELDS = USER_FIELDS + ('image_renditions',)
+AUTHOR_USER_FIELDS = ('is_subscribed',)
+# Поля рецепта, нужные для чтения через снимки, включая ключи сортировки
+SNAPSHOT_READ_FIELDS = (
+    'id', 'pub_date', 'image', 'image_key', 'popular_score', 'trending_score'
+)
+
+
+def get_recipe_queryset():
+    """
+    Рецепты с заранее загруженными автором, тегами и ингредиентами:
+    число запросов не зависит от количества рецептов на странице.
+    """
+    return Recipe.objects.select_related('author').prefetch_related(
+        'tag',
+        Prefetch(
+            'pieces',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        ),
+    )
+
+
+def serialize_snapshot(recipe):
+    # Поля, вычисляемые при чтении, остаются пустыми, чтобы сохранить
+    # порядок полей ответа.
+    data = RecipeGetSerializer(recipe).data
+    for field in READ_FIELDS:
+        data[field] = None
+    for field in AUTHOR_USER_FIELDS:
+        data['author'][field] = None
+    return data
+
+
+def build_snapshots(recipe_ids):
+    """
+    Свежие снимки рецептов: словарь {recipe_id: data}. Снимки сохраняются,
+    поэтому данные читаются из основной базы, а не из реплики.
+    """
+    with primary():
+        return {
+            recipe.pk: serialize_snapshot(recipe)
+            for recipe in get_recipe_queryset().filter(pk__in=recipe_ids)
+        }
+
+
+def create_empty_snapshots(recipe_ids):
+    RecipeSnapshot.objects.bulk_create(
+        [RecipeSnapshot(recipe_id=pk) for pk in recipe_ids],
+        ignore_conflicts=True
+    )
+
+
+@transaction.atomic
+def refresh_snapshots(recipe_ids):
+    """
+    Пересборка снимков рецептов. Вызывается в транзакции изменения, чтобы
+    снимок фиксировался вместе с данными. Возвращает собранные снимки.
+    """
+    recipe_ids = list(recipe_ids)
+    snapshots = {}
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        batch = build_snapshots(recipe_ids[start:start + BATCH_SIZE])
+        # Новая версия, чтобы сборка при чтении, начатая до изменения, не
+        # записала устаревшие данные поверх свежих
+        create_empty_snapshots(batch)
+        for pk, data in batch.items():
+            RecipeSnapshot.objects.filter(recipe_id=pk).update(
+                data=json.dumps(data), version=F('version') + 1
+            )
+        snapshots.update(batch)
+    return snapshots
+
+
+def drop_snapshots(**lookups):
+    """
+    Сброс устаревших снимков рецептов в транзакции изменения. Снимки
+    собираются заново при следующем чтении.
+    """
+    RecipeSnapshot.objects.filter(**lookups).update(
+        data='', version=F('version') + 1
+    )
+
+
+def rebuild_snapshots(recipe_ids):
+    """
+    Сборка недостающих и сброшенных снимков при чтении. Снимок
+    сохраняется, только если его версия не изменилась с начала сборки:
+    иначе параллельное изменение успело его сбросить, а собранные данные
+    могут быть прочитаны до этого изменения.
+    """
+    with primary():
+        create_empty_snapshots(recipe_ids)
+        versions = dict(RecipeSnapshot.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'version'))
+        snapshots = build_snapshots(recipe_ids)
+        for pk, data in snapshots.items():
+            RecipeSnapshot.objects.filter(
+                recipe_id=pk, version=versions[pk]
+            ).update(data=json.dumps(data))
+    return snapshots
+
+
+def load_snapshots(recipe_ids):
+    """
+    Снимки рецептов одним запросом. Недостающие снимки, например после
+    массовой загрузки данных, и сброшенные собираются заново.
+    """
+    snapshots = {
+        recipe_id: json.loads(data)
+        for recipe_id, data in RecipeSnapshot.objects.filter(
+            recipe_id__in=recipe_ids
+        ).exclude(data='').values_list('recipe_id', 'data')
+    }
+    missing = set(recipe_ids) - snapshots.keys()
+    if missing:
+        snapshots.update(rebuild_snapshots(missing))
+    return snapshots
+
+
+def merge_snapshot(recipe, snapshot):
+    """Снимок рецепта с флагами текущего пользователя из аннотаций."""
+    data = dict(snapshot)
+    data['author'] = dict(
+        data['author'],
+        is_subscribed=getattr(recipe, 'is_subscribed_to_author', False)
+    )
+    for field in USER_FIELDS:
+        data[field] = getattr(recipe, field, False)
+    data['image_renditions'] = get_image_renditions(recipe)
+    return data
+
+
+class RecipeSnapshotListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = list(data)
+        self.child.snapshots = load_snapshots(
+            [recipe.pk for recipe in recipes]
+        )
+        return super().to_representation(recipes)
+
+
+class RecipeSnapshotSerializer(
+    TimedSerializerMixin, serializers.BaseSerializer
+):
+    """
+    Чтение рецептов из снимков. Ожидает рецепты с аннотациями флагов
+    пользователя и полями SNAPSHOT_READ_FIELDS.
+    """
+
+    snapshots = None
+
+    class Meta:
+        list_serializer_class = RecipeSnapshotListSerializer
+
+    def to_representation(self, instance):
+        if self.snapshots is None:
+            self.snapshots = load_snapshots([instance.pk])
+        return merge_snapshot(instance, self.snapshots[instance.pk])
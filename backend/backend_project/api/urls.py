@@ -3,11 +3,17 @@ from rest_framework.routers import DefaultRouter
 
 from .views import (
     CustomUserViewSet, UsersMeApiView, ChangePasswordView, TagViewSet,
-    IngredientViewSet, RecipeViewSet, SubscriptionPostDeleteView,
+    IngredientViewSet, RecipeViewSet, RecipeFeedView, RecipeSimilarView,
+    SubscriptionPostDeleteView,
     SubscriptionGetViewSet,
     FavoritePostDeleteView,
+    FavoriteBulkView,
     ShoppingCartPostDeleteView,
-    DownloadShoppingCartView
+    ShoppingCartBulkView,
+    DownloadShoppingCartView,
+    ShoppingListExportView,
+    ShoppingListExportDetailView,
+    ShoppingListExportFileView
 )
 
 app_name = 'api'
@@ -29,6 +35,8 @@ urlpatterns = [
     path('users/set_password/', ChangePasswordView.as_view()),
     path('users/me/', UsersMeApiView.as_view()),
 
+    path('recipes/favorite/', FavoriteBulkView.as_view()),
+    path('recipes/shopping_cart/', ShoppingCartBulkView.as_view()),
     re_path(
         r'recipes/(?P<id>\d+)/favorite', FavoritePostDeleteView.as_view()
     ),
@@ -41,8 +49,22 @@ urlpatterns = [
         'users/subscriptions/', SubscriptionGetViewSet.as_view({'get': 'list'})
     ),
 
+    path('recipes/feed/', RecipeFeedView.as_view()),
+    path('recipes/<int:id>/similar/', RecipeSimilarView.as_view()),
     path(
         'recipes/download_shopping_cart/', DownloadShoppingCartView.as_view()
     ),
+    path(
+        'recipes/download_shopping_cart/exports/',
+        ShoppingListExportView.as_view()
+    ),
+    path(
+        'recipes/download_shopping_cart/exports/<int:pk>/',
+        ShoppingListExportDetailView.as_view()
+    ),
+    path(
+        'recipes/download_shopping_cart/exports/<int:pk>/file/',
+        ShoppingListExportFileView.as_view()
+    ),
     path('', include(router_v1.urls)),
 ]
@@ -0,0 +1,286 @@
+import io
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import (
+    Case, Exists, F, IntegerField, OuterRef, Sum, Value, When, Window
+)
+from django.db.models.functions import RowNumber
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .popularity import get_score_changes
+from app.models import (
+    FavoriteRecipe, Recipe, RecipeIngredient, ShoppingCart, ShoppingListItem,
+    User
+)
+
+ADDED = 'added'
+ALREADY_ADDED = 'already_added'
+REMOVED = 'removed'
+NOT_ADDED = 'not_added'
+NOT_FOUND = 'not_found'
+RECIPE_COUNTERS = {
+    FavoriteRecipe: 'favorites_count',
+    ShoppingCart: 'shopping_carts_count',
+}
+
+_bulk_maintenance = ContextVar('bulk_maintenance', default=False)
+
+
+@contextmanager
+def bulk_maintenance():
+    """
+    Блок пакетных изменений, которые сами поддерживают счетчики и списки
+    покупок одним запросом на пачку. Обработчики сигналов отдельных
+    объектов внутри блока их не меняют.
+    """
+    token = _bulk_maintenance.set(True)
+    try:
+        yield
+    finally:
+        _bulk_maintenance.reset(token)
+
+
+def in_bulk_maintenance():
+    return _bulk_maintenance.get()
+
+
+def change_counter(queryset, field, delta):
+    """Атомарное изменение денормализованного счетчика выражением F()."""
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_recipe_counters(model, events, delta):
+    """
+    Счетчик избранного или корзин (model) и оценки популярности рецептов
+    одним UPDATE. events — пары (recipe_id, created) добавленных
+    (delta > 0) или удаленных записей.
+    """
+    events = list(events)
+    field = RECIPE_COUNTERS[model]
+    return Recipe.objects.filter(
+        pk__in=[recipe_id for recipe_id, _ in events]
+    ).update(
+        **{field: F(field) + delta}, **get_score_changes(model, events, delta)
+    )
+
+
+def get_shopping_list(user):
+    """
+    Сводный список покупок пользователя.
+
+    Читается из поддерживаемой инкрементально таблицы ShoppingListItem.
+    Возвращает кортежи (название, единица измерения, количество),
+    отсортированные по названию ингредиента.
+    """
+    return ShoppingListItem.objects.filter(
+        user=user, amount__gt=0
+    ).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+def get_live_shopping_lists():
+    """
+    Пересчет списков покупок всех пользователей по корзинам одним запросом
+    с GROUP BY. Возвращает словарь {(user_id, ingredient_id): amount}.
+    """
+    totals = ShoppingCart.objects.filter(
+        recipe__pieces__isnull=False
+    ).values(
+        'user_id', 'recipe__pieces__ingredient_id'
+    ).annotate(
+        amount=Sum('recipe__pieces__amount')
+    ).values_list(
+        'user_id', 'recipe__pieces__ingredient_id', 'amount'
+    ).order_by()
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in totals.iterator()
+    }
+
+
+def change_shopping_lists(user_ids, amounts):
+    """
+    Изменение количеств ингредиентов в списках покупок пользователей.
+    amounts — словарь {ingredient_id: изменение количества}.
+    """
+    user_ids = list(user_ids)
+    amounts = {pk: amount for pk, amount in amounts.items() if amount}
+    if not user_ids or not amounts:
+        return
+    with transaction.atomic():
+        ShoppingListItem.objects.bulk_create(
+            [
+                ShoppingListItem(user_id=user_id, ingredient_id=pk)
+                for user_id in user_ids
+                for pk, amount in amounts.items() if amount > 0
+            ],
+            ignore_conflicts=True
+        )
+        items = ShoppingListItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=amounts
+        )
+        items.update(amount=F('amount') + Case(
+            *[
+                When(ingredient_id=pk, then=Value(amount))
+                for pk, amount in amounts.items()
+            ],
+            default=Value(0),
+            output_field=IntegerField()
+        ))
+        if any(amount < 0 for amount in amounts.values()):
+            items.filter(amount__lte=0).delete()
+
+
+def change_shopping_list_by_recipes(user_id, recipe_ids, sign):
+    """Изменение списка покупок пользователя на ингредиенты рецептов."""
+    if not recipe_ids:
+        return
+    change_shopping_lists([user_id], {
+        pk: sign * amount
+        for pk, amount in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values('ingredient_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total').order_by()
+    })
+
+
+def change_shopping_lists_by_piece(recipe_id, ingredient_id, amount):
+    """
+    Изменение списков покупок всех пользователей с рецептом в корзине на
+    количество ингредиента.
+    """
+    change_shopping_lists(
+        ShoppingCart.objects.filter(recipe_id=recipe_id).values_list(
+            'user_id', flat=True
+        ),
+        {ingredient_id: amount}
+    )
+
+
+def lock_user(user):
+    """Блокировка строки пользователя до конца транзакции."""
+    list(User.objects.select_for_update().filter(pk=user.pk).values('pk'))
+
+
+def lock_user_recipes(model, user, recipe_ids):
+    """
+    Рецепты из recipe_ids с флагом is_added — есть ли рецепт в избранном
+    или корзине (model) пользователя. Строка пользователя блокируется до
+    конца транзакции, чтобы параллельные запросы одного пользователя,
+    например двойной клик, не изменили счетчики дважды.
+    """
+    lock_user(user)
+    return list(Recipe.objects.filter(pk__in=recipe_ids).annotate(
+        is_added=Exists(model.objects.filter(user=user, recipe=OuterRef('pk')))
+    ).only('id', 'name', 'image', 'image_key', 'cooking_time'))
+
+
+def set_statuses(recipe_ids, recipes, status_added, status_not_added):
+    statuses = dict.fromkeys(recipe_ids, NOT_FOUND)
+    statuses.update(
+        (recipe.pk, status_added if recipe.is_added else status_not_added)
+        for recipe in recipes
+    )
+    return statuses
+
+
+@transaction.atomic
+def add_user_recipes(model, user, recipe_ids):
+    """
+    Добавление рецептов в избранное или корзину (model) одним INSERT с
+    пропуском конфликтов. Возвращает статусы по идентификаторам рецептов
+    и список рецептов.
+    """
+    recipes = lock_user_recipes(model, user, recipe_ids)
+    added = [recipe.pk for recipe in recipes if not recipe.is_added]
+    if added:
+        created = model.objects.bulk_create(
+            [model(user=user, recipe_id=pk) for pk in added],
+            ignore_conflicts=True
+        )
+        change_recipe_counters(model, [
+            (entry.recipe_id, entry.created) for entry in created
+        ], 1)
+    if model is ShoppingCart:
+        change_shopping_list_by_recipes(user.pk, added, 1)
+    return set_statuses(recipe_ids, recipes, ALREADY_ADDED, ADDED), recipes
+
+
+@transaction.atomic
+def remove_user_recipes(model, user, recipe_ids):
+    """
+    Удаление рецептов из избранного или корзины (model) одним DELETE.
+    Возвращает статусы по идентификаторам рецептов.
+    """
+    recipes = lock_user_recipes(model, user, recipe_ids)
+    removed = [recipe.pk for recipe in recipes if recipe.is_added]
+    if removed:
+        entries = model.objects.filter(user=user, recipe_id__in=removed)
+        events = list(entries.values_list('recipe_id', 'created'))
+        with bulk_maintenance():
+            entries.delete()
+        change_recipe_counters(model, events, -1)
+    if model is ShoppingCart:
+        change_shopping_list_by_recipes(user.pk, removed, -1)
+    return set_statuses(recipe_ids, recipes, REMOVED, NOT_ADDED)
+
+
+def render_shopping_list_pdf(shopping_list):
+    """Отрисовка списка покупок в PDF. Возвращает буфер с документом."""
+
+    line = 800
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer)
+    pdfmetrics.registerFont(TTFont(
+        'DejaVuSerif', 'DejaVuSerif.ttf', 'UTF-8'
+    ))
+    p.setFont('DejaVuSerif', 20)
+    p.drawString(15, line, 'Список покупок.')
+    line -= 40
+    p.setFont('DejaVuSerif', 12)
+
+    for name, measurement_unit, amount in shopping_list:
+        line -= 20
+        p.drawString(
+            10, line,
+            f'{name}, {measurement_unit}........{amount}'.capitalize()
+        )
+    p.save()
+    buffer.seek(0)
+    return buffer
+
+
+def get_recipes_by_author(authors, limit=None):
+    """
+    Первые limit рецептов каждого автора одним запросом с ROW_NUMBER()
+    по разделам автора. Возвращает словарь {author_id: [recipe, ..]}.
+    """
+    if not authors:
+        return {}
+    recipes = Recipe.objects.filter(author__in=authors).only(
+        'id', 'author_id', 'name', 'image', 'image_key', 'cooking_time'
+    )
+    if limit is None:
+        recipes = list(recipes)
+    else:
+        windowed = recipes.annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )).order_by()
+        sql, params = windowed.query.get_compiler(windowed.db).as_sql()
+        recipes = Recipe.objects.db_manager(windowed.db).raw(
+            f'SELECT * FROM ({sql}) AS windowed WHERE row_number <= %s'
+            ' ORDER BY row_number',
+            params + (limit,)
+        )
+    recipes_by_author = {}
+    for recipe in recipes:
+        recipes_by_author.setdefault(recipe.author_id, []).append(recipe)
+    return recipes_by_author
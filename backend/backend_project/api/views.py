@@ -1,28 +1,46 @@
-import io
-
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import BooleanField, Exists, OuterRef, Value
+from django.conf import settings
+from django.http import FileResponse, Http404
 from django.shortcuts import get_object_or_404
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
+from django.utils.cache import patch_cache_control
 from rest_framework import mixins, status, viewsets
 from rest_framework.generics import CreateAPIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .filters import RecipeFilter
-from .paginators import PageLimitPagination
+from .catalog import (
+    INGREDIENTS_CATALOG, RECIPES_NAMESPACE, TAGS_CATALOG, register_catalog
+)
+from .exports import start_export
+from .feed import backfill, fan_out, get_feed_sources, prune
+from .filters import RECIPE_ORDERINGS, RecipeFilter
+from .paginators import MergedCursorPagination, PageLimitPagination
 from .permissions import Follower, ReadOnly, IsAuthorOrReadOnly
+from .replicas import ReplicaReadMixin
+from .response_cache import ResponseCacheMixin
+from .search import ingredients_catalog, search_ingredients
+from .similarity import schedule_similar_recipes
 from .serializers import (
     ChangePasswordSerializer, IngredientUnitSerializer, RecipeGetSerializer,
-    RecipeNestedSerializer, RecipePostSerializer, SubscriptionGetSerializer,
-    TagSerializer, UserSerializer
+    RecipeIdsSerializer, RecipeNestedSerializer, RecipePostSerializer,
+    ShoppingListExportSerializer, SubscriptionGetSerializer, TagSerializer,
+    UserSerializer
+)
+from .snapshots import (
+    SNAPSHOT_READ_FIELDS, RecipeSnapshotSerializer, get_recipe_queryset,
+    refresh_snapshots
+)
+from .utils import (
+    ALREADY_ADDED, NOT_FOUND, REMOVED, add_user_recipes,
+    get_recipes_by_author, get_shopping_list, remove_user_recipes,
+    render_shopping_list_pdf
 )
 from app.models import (
-    FavoriteRecipe, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
-    Subscription, Tag, User
+    FavoriteRecipe, Ingredient, Recipe, ShoppingCart, ShoppingListExport,
+    SimilarRecipe, Subscription, Tag, User
 )
 
 
@@ -39,6 +57,26 @@ REMOVED_FROM_SHOPPING_LIST = (
 )
 
 
+def annotate_user_flags(queryset, user):
+    """
+    Флаги рецептов для текущего пользователя вычисляются подзапросами
+    EXISTS в основном запросе, а не отдельным запросом на каждый рецепт.
+    """
+    if user.is_anonymous:
+        return queryset
+    return queryset.annotate(
+        is_favorited=Exists(FavoriteRecipe.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        )),
+        is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        )),
+        is_subscribed_to_author=Exists(Subscription.objects.filter(
+            user=user, author=OuterRef('author')
+        )),
+    )
+
+
 # Вью-сеты эндпойнтов для работы с пользователями
 
 class CustomUserViewSet(
@@ -90,7 +128,34 @@ class ChangePasswordView(CreateAPIView):
 
 # Вью-сеты эндпойнтов, участвующих в создании и получении рецепта
 
+class CatalogMixin:
+    """
+    Ответы справочников из кэша в памяти процесса с ETag и Cache-Control,
+    чтобы nginx и браузеры могли перепроверять их без тела ответа.
+    """
+
+    catalog = None
+
+    def catalog_response(self, version, data):
+        etag = f'"{self.catalog.name}-{version}"'
+        if etag in self.request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE
+        )
+        return response
+
+
+def load_tags():
+    return list(TagSerializer(Tag.objects.all(), many=True).data)
+
+
 class TagViewSet(
+    ReplicaReadMixin,
+    CatalogMixin,
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
     viewsets.GenericViewSet
@@ -99,9 +164,22 @@ class TagViewSet(
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
+    catalog = register_catalog(TAGS_CATALOG, load_tags)
+
+    def list(self, request, *args, **kwargs):
+        return self.catalog_response(*self.catalog.get())
+
+    def retrieve(self, request, *args, **kwargs):
+        version, tags = self.catalog.get()
+        for tag in tags:
+            if str(tag['id']) == self.kwargs['pk']:
+                return self.catalog_response(version, tag)
+        raise Http404
 
 
 class IngredientViewSet(
+    ReplicaReadMixin,
+    CatalogMixin,
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
     viewsets.GenericViewSet
@@ -109,38 +187,158 @@ class IngredientViewSet(
 
     serializer_class = IngredientUnitSerializer
     permission_classes = (AllowAny,)
+    catalog = ingredients_catalog
 
     def get_queryset(self):
         name_param = self.request.query_params.get('name', None)
         if name_param:
-            return Ingredient.objects.filter(
-                name__icontains=name_param.lower()
-            )
+            return search_ingredients(name_param)
         return Ingredient.objects.all()
 
+    def list(self, request, *args, **kwargs):
+        version, ingredients = self.catalog.get()
+        if request.query_params.get('name'):
+            serializer = self.get_serializer(self.get_queryset(), many=True)
+            return self.catalog_response(version, serializer.data)
+        return self.catalog_response(version, ingredients['list'])
+
+    def retrieve(self, request, *args, **kwargs):
+        version, ingredients = self.catalog.get()
+        ingredient = ingredients['by_id'].get(
+            int(self.kwargs['pk']) if self.kwargs['pk'].isdigit() else None
+        )
+        if ingredient is None:
+            raise Http404
+        return self.catalog_response(version, ingredient)
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ReplicaReadMixin, ResponseCacheMixin, viewsets.ModelViewSet
+):
 
-    queryset = Recipe.objects.all()
     serializer_class = RecipeGetSerializer
     permission_classes = (IsAuthorOrReadOnly,)
     pagination_class = PageLimitPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    # Записи рецептов, тегов и ингредиентов сбрасывают закэшированное
+    # количество рецептов в выборках, общих для всех пользователей
+    count_cache_namespaces = (
+        RECIPES_NAMESPACE, TAGS_CATALOG, INGREDIENTS_CATALOG
+    )
+    # С этими фильтрами количество зависит от пользователя и не кэшируется
+    user_count_filters = ('is_favorited', 'is_in_shopping_cart')
+
+    @property
+    def cursor_ordering(self):
+        return RECIPE_ORDERINGS.get(
+            self.request.query_params.get('ordering'), ('-pub_date', '-id')
+        )
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+            # Данные рецепта берутся из снимка, из таблицы рецептов нужны
+            # только поля сортировки, изображения и флаги пользователя
+            queryset = Recipe.objects.only(*SNAPSHOT_READ_FIELDS)
+        else:
+            queryset = get_recipe_queryset()
+        return annotate_user_flags(queryset, self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
 
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update'):
             return RecipePostSerializer
+        if self.action in ('list', 'retrieve'):
+            return RecipeSnapshotSerializer
         return RecipeGetSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        fan_out(recipe)
+        refresh_snapshots([recipe.pk])
+        schedule_similar_recipes(recipe.pk)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        recipe = serializer.save()
+        refresh_snapshots([recipe.pk])
+        schedule_similar_recipes(recipe.pk)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # Счетчики и списки покупок меняют обработчики сигналов удаления
+        # рецепта, его корзин и ингредиентов
+        instance.delete()
+
+
+class RecipeFeedView(APIView):
+    """
+    Лента новых рецептов авторов из подписок пользователя: записи,
+    разосланные при публикации, и рецепты популярных авторов.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    pagination_class = MergedCursorPagination
+
+    def get(self, request):
+        paginator = self.pagination_class()
+        keys = paginator.paginate_sources(
+            get_feed_sources(request.user), request
+        )
+        recipes = annotate_user_flags(
+            Recipe.objects.only(*SNAPSHOT_READ_FIELDS), request.user
+        ).in_bulk([recipe_id for _, recipe_id in keys])
+        serializer = RecipeSnapshotSerializer(
+            [
+                recipes[recipe_id] for _, recipe_id in keys
+                if recipe_id in recipes
+            ],
+            many=True, context={'request': request}
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+
+class RecipeSimilarView(ReplicaReadMixin, APIView):
+    """
+    Похожие рецепты по общим ингредиентам и тегам. Читаются одним
+    запросом по индексу из таблицы, заполняемой пересчетом.
+    """
+
+    permission_classes = (AllowAny,)
+
+    def get(self, request, **kwargs):
+        similar = [
+            row.similar for row in SimilarRecipe.objects.filter(
+                recipe_id=self.kwargs['id']
+            ).select_related('similar').only(
+                'score', 'similar', *[
+                    f'similar__{field}' for field in (
+                        'id', 'name', 'image', 'image_key', 'cooking_time'
+                    )
+                ]
+            ).order_by('-score')
+        ]
+        if not similar:
+            get_object_or_404(Recipe, id=self.kwargs['id'])
+        serializer = RecipeNestedSerializer(
+            similar, many=True, context={'request': request}
+        )
+        return Response(serializer.data)
 
 
 class SubscriptionPostDeleteView(APIView):
 
     permission_classes = [Follower | ReadOnly]
 
+    @transaction.atomic
     def post(self, request, **kwargs):
         author = get_object_or_404(User, id=self.kwargs['id'])
         if author == self.request.user:
@@ -151,7 +349,7 @@ class SubscriptionPostDeleteView(APIView):
                 },
                 status=status.HTTP_400_BAD_REQUEST
             )
-        subscription, created = Subscription.objects.get_or_create(
+        _, created = Subscription.objects.get_or_create(
             user=self.request.user, author=author
         )
         if not created:
@@ -162,16 +360,17 @@ class SubscriptionPostDeleteView(APIView):
                 },
                 status=status.HTTP_400_BAD_REQUEST
             )
-        subscription.save()
+        backfill(self.request.user.pk, author.pk)
         serializer = SubscriptionGetSerializer(author)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete(self, requets, **kwargs):
+        author = get_object_or_404(User, id=self.kwargs['id'])
         get_object_or_404(
-            Subscription,
-            user=self.request.user,
-            author=get_object_or_404(User, id=self.kwargs['id'])
+            Subscription, user=self.request.user, author=author
         ).delete()
+        prune(self.request.user.pk, author.pk)
         return Response(
             {
                 'status': SUCCESS_STATUS,
@@ -182,19 +381,29 @@ class SubscriptionPostDeleteView(APIView):
 
 
 class SubscriptionGetViewSet(
-    mixins.ListModelMixin, viewsets.GenericViewSet
+    ReplicaReadMixin, mixins.ListModelMixin, viewsets.GenericViewSet
 ):
     serializer_class = SubscriptionGetSerializer
     pagination_class = PageLimitPagination
     permission_classes = (IsAuthenticated,)
+    cursor_ordering = ('email', 'id')
 
     def get_queryset(self):
-        queryset = User.objects.filter(
-            id__in=self.request.user.follower.all().values_list(
-                'author__id', flat=True
-            )
+        return User.objects.filter(author__user=self.request.user).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
         )
-        return queryset
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        context = self.get_serializer_context()
+        # Рецепты всех авторов страницы загружаются одним запросом.
+        context['recipes'] = get_recipes_by_author(
+            page, context.get('recipes_limit')
+        )
+        serializer = self.get_serializer_class()(
+            page, many=True, context=context
+        )
+        return self.get_paginated_response(serializer.data)
 
     # По ТЗ  - Количество объектов внутри поля recipes.
     # Передача в сериалайзер нормализованного значения через доп. контекст.
@@ -209,63 +418,98 @@ class SubscriptionGetViewSet(
         return context
 
 
-# Вью-сет добавления и удаления из избранного
-class FavoritePostDeleteView(APIView):
+class UserRecipeView(APIView):
+    """
+    Добавление рецепта в избранное или корзину (model) пользователя и
+    удаление из них. Используется тот же путь, что и в массовых
+    операциях, — один INSERT или DELETE.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    model = None
+    already_added_message = None
 
     def post(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=self.kwargs['id'])
-        serializer = RecipeNestedSerializer(recipe)
-        favorite, created = FavoriteRecipe.objects.get_or_create(
-            user=self.request.user, recipe=recipe
+        recipe_id = int(self.kwargs['id'])
+        statuses, recipes = add_user_recipes(
+            self.model, request.user, [recipe_id]
         )
-        if not created:
+        if statuses[recipe_id] == NOT_FOUND:
+            raise Http404
+        if statuses[recipe_id] == ALREADY_ADDED:
             return Response(
                 {
                     'status': ERROR_STATUS,
-                    'message': ALREADY_IN_FAVORITES,
+                    'message': self.already_added_message,
                 },
                 status=status.HTTP_400_BAD_REQUEST
             )
-        favorite.save()
+        serializer = RecipeNestedSerializer(recipes[0])
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    def delete(self, requets, **kwargs):
-        recipe = get_object_or_404(Recipe, id=self.kwargs['id'])
-        favorite = get_object_or_404(
-            FavoriteRecipe, user=self.request.user, recipe=recipe
-        )
-        favorite.delete()
+    def delete(self, request, **kwargs):
+        recipe_id = int(self.kwargs['id'])
+        statuses = remove_user_recipes(self.model, request.user, [recipe_id])
+        if statuses[recipe_id] != REMOVED:
+            raise Http404
+        return self.get_removed_response()
+
+    def get_removed_response(self):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-# Вью - сеты функционла корзины
-class ShoppingCartPostDeleteView(APIView):
+class UserRecipesBulkView(APIView):
+    """
+    Массовое добавление рецептов в избранное или корзину (model) и
+    удаление из них. Тело запроса — {"ids": [...]}, в ответе статус
+    для каждого идентификатора.
+    """
 
     permission_classes = (IsAuthenticated,)
+    model = None
 
-    def post(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=self.kwargs['id'])
-        shopping_list, created = ShoppingCart.objects.get_or_create(
-            user=self.request.user, recipe=recipe
+    def get_recipe_ids(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['ids']
+
+    def get_response(self, statuses):
+        return Response({'results': [
+            {'id': recipe_id, 'status': recipe_status}
+            for recipe_id, recipe_status in statuses.items()
+        ]})
+
+    def post(self, request):
+        statuses, _ = add_user_recipes(
+            self.model, request.user, self.get_recipe_ids(request)
         )
-        if not created:
-            return Response(
-                {
-                    'status': ERROR_STATUS,
-                    'message': ALREADY_IN_SHOPPING_LIST,
-                },
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        shopping_list.save()
-        serializer = RecipeNestedSerializer(recipe)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.get_response(statuses)
 
-    def delete(self, requets, **kwargs):
-        get_object_or_404(
-            ShoppingCart,
-            user=self.request.user,
-            recipe=get_object_or_404(Recipe, id=self.kwargs['id'])
-        ).delete()
+    def delete(self, request):
+        return self.get_response(remove_user_recipes(
+            self.model, request.user, self.get_recipe_ids(request)
+        ))
+
+
+# Вью-сет добавления и удаления из избранного
+class FavoritePostDeleteView(UserRecipeView):
+
+    model = FavoriteRecipe
+    already_added_message = ALREADY_IN_FAVORITES
+
+
+class FavoriteBulkView(UserRecipesBulkView):
+
+    model = FavoriteRecipe
+
+
+# Вью - сеты функционла корзины
+class ShoppingCartPostDeleteView(UserRecipeView):
+
+    model = ShoppingCart
+    already_added_message = ALREADY_IN_SHOPPING_LIST
+
+    def get_removed_response(self):
         return Response(
             {
                 'status': SUCCESS_STATUS,
@@ -275,47 +519,60 @@ class ShoppingCartPostDeleteView(APIView):
         )
 
 
+class ShoppingCartBulkView(UserRecipesBulkView):
+
+    model = ShoppingCart
+
+
 class DownloadShoppingCartView(APIView):
 
     permission_classes = (IsAuthenticated,)
 
     def get(self, request, **kwargs):
-
-        recipes = Recipe.objects.filter(
-            id__in=ShoppingCart.objects.filter(
-                user=self.request.user
-            ).values_list('recipe__id', flat=True)
+        buffer = render_shopping_list_pdf(
+            get_shopping_list(self.request.user)
         )
-        shopping_list = {}
-        for recipe in recipes:
-            for piece in RecipeIngredient.objects.filter(recipe=recipe):
-                key = (
-                    f'{str(piece.ingredient.name)}'
-                    f', {str(piece.ingredient.measurement_unit)}'
-                )
-                if shopping_list.get(key):
-                    shopping_list[key] += piece.amount
-                else:
-                    shopping_list[key] = piece.amount
-
-        line = 800
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer)
-        pdfmetrics.registerFont(TTFont(
-            'DejaVuSerif', 'DejaVuSerif.ttf', 'UTF-8'
-        ))
-        p.setFont('DejaVuSerif', 20)
-        p.drawString(15, line, 'Список покупок.')
-        line -= 40
-        p.setFont('DejaVuSerif', 12)
-
-        for ingredient, amount in sorted(shopping_list.items()):
-            line -= 20
-            p.drawString(
-                10, line, f'{ingredient}........{amount}'.capitalize()
-            )
-        p.save()
-        buffer.seek(0)
         return FileResponse(
             buffer, as_attachment=True, filename='shopping-list.pdf'
         )
+
+
+# Асинхронная выгрузка списка покупок: задание выполняет обработчик
+# run_export_worker, клиент опрашивает статус и скачивает готовый файл.
+class ShoppingListExportView(APIView):
+
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, **kwargs):
+        export = start_export(self.request.user)
+        serializer = ShoppingListExportSerializer(export)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+class ShoppingListExportDetailView(APIView):
+
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, **kwargs):
+        export = get_object_or_404(
+            ShoppingListExport, pk=self.kwargs['pk'], user=self.request.user
+        )
+        serializer = ShoppingListExportSerializer(export)
+        return Response(serializer.data)
+
+
+class ShoppingListExportFileView(APIView):
+
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, **kwargs):
+        export = get_object_or_404(
+            ShoppingListExport,
+            pk=self.kwargs['pk'],
+            user=self.request.user,
+            status=ShoppingListExport.DONE
+        )
+        return FileResponse(
+            export.file.open('rb'), as_attachment=True,
+            filename='shopping-list.pdf'
+        )
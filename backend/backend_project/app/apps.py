@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_migrate
+
+
+def create_trigram_extension(using, **kwargs):
+    """Расширение pg_trgm нужно для триграммного индекса ингредиентов."""
+    from django.db import connections
+
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
 
 
 class AppConfig(AppConfig):
     name = 'app'
+
+    def ready(self):
+        pre_migrate.connect(create_trigram_extension, sender=self)
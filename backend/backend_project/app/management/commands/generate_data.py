@@ -0,0 +1,160 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection, transaction
+
+from api.catalog import RECIPES_NAMESPACE, bump_version
+from app.models import (
+    FavoriteRecipe, Ingredient, Recipe, RecipeIngredient, RecipeTag,
+    ShoppingCart, Subscription, Tag, User
+)
+
+BATCH_SIZE = 1000
+SEED = 19
+PASSWORD = 'generated-password'
+NO_INGREDIENTS = 'Import ingredients and create tags before generating data'
+GENERATED = 'Generated {count} {name} in {elapsed:.1f} s'
+NAME_WORDS = (
+    'суп салат пирог каша запеканка рагу соус омлет блины котлеты '
+    'жаркое плов паста кекс штрудель'
+).split()
+TEXT_WORDS = (
+    'нарезать смешать обжарить добавить посолить поперчить варить '
+    'запекать остудить подавать минут духовке сковороде кастрюле '
+    'мелко крупно слегка до готовности на медленном огне'
+).split()
+
+
+def words(generator, vocabulary, count):
+    return ' '.join(generator.choice(vocabulary) for _ in range(count))
+
+
+def pairs(generator, users, targets, per_user, allow_self=True):
+    """Случайные уникальные пары (пользователь, объект)."""
+    for user_id in users:
+        sample = generator.sample(targets, min(per_user, len(targets)))
+        for target_id in sample:
+            if allow_self or target_id != user_id:
+                yield user_id, target_id
+
+
+class Command(BaseCommand):
+    """
+    Менеджмент команда для генерации тестовых данных заданного объема:
+    пользователи, рецепты с тегами и ингредиентами, подписки, избранное
+    и корзины. Результат детерминирован зерном --seed, данные вставляются
+    пачками. Денормализованные счетчики, оценки популярности, списки
+    покупок, ленты подписок, поисковый индекс и похожие рецепты
+    пересчитываются в конце.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--subscriptions', type=int, default=10)
+        parser.add_argument('--favorites', type=int, default=20)
+        parser.add_argument('--carts', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=SEED)
+        parser.add_argument('--prefix', type=str, default='generated')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def insert(self, model, objects, batch_size):
+        start = time.monotonic()
+        objects = list(objects)
+        # На SQLite размер пачки ограничен числом параметров запроса
+        batch_size = min(batch_size, connection.ops.bulk_batch_size(
+            model._meta.concrete_fields, objects
+        ))
+        model.objects.bulk_create(
+            objects, batch_size=batch_size, ignore_conflicts=True
+        )
+        self.stdout.write(GENERATED.format(
+            count=len(objects), name=model._meta.verbose_name_plural,
+            elapsed=time.monotonic() - start
+        ))
+
+    def handle(self, *args, **kwargs):
+        generator = random.Random(kwargs['seed'])
+        prefix = kwargs['prefix']
+        batch_size = kwargs['batch_size']
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        if not ingredient_ids or not tag_ids:
+            raise CommandError(NO_INGREDIENTS)
+        with transaction.atomic():
+            # Хэш пароля вычисляется один раз для всех пользователей
+            password = make_password(PASSWORD)
+            self.insert(User, (
+                User(
+                    username=f'{prefix}-{number}',
+                    email=f'{prefix}-{number}@example.com',
+                    first_name=words(generator, NAME_WORDS, 1),
+                    last_name=words(generator, NAME_WORDS, 1),
+                    password=password
+                ) for number in range(kwargs['users'])
+            ), batch_size)
+            user_ids = list(User.objects.filter(
+                username__startswith=f'{prefix}-'
+            ).order_by('pk').values_list('pk', flat=True))
+            self.insert(Recipe, (
+                Recipe(
+                    author_id=generator.choice(user_ids),
+                    name=words(generator, NAME_WORDS, 3),
+                    text=words(generator, TEXT_WORDS, 30),
+                    image='recipes/images/generated.jpg',
+                    cooking_time=generator.randint(1, 180),
+                    slug=f'{prefix}-{number}'
+                ) for number in range(kwargs['recipes'])
+            ), batch_size)
+            recipe_ids = list(Recipe.objects.filter(
+                slug__startswith=f'{prefix}-'
+            ).order_by('pk').values_list('pk', flat=True))
+            self.insert(RecipeTag, (
+                RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in generator.sample(
+                    tag_ids, generator.randint(1, min(2, len(tag_ids)))
+                )
+            ), batch_size)
+            self.insert(RecipeIngredient, (
+                RecipeIngredient(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id,
+                    amount=generator.randint(1, 500)
+                ) for recipe_id, ingredient_id in pairs(
+                    generator, recipe_ids, ingredient_ids,
+                    kwargs['ingredients_per_recipe']
+                )
+            ), batch_size)
+            self.insert(Subscription, (
+                Subscription(user_id=user_id, author_id=author_id)
+                for user_id, author_id in pairs(
+                    generator, user_ids, user_ids, kwargs['subscriptions'],
+                    allow_self=False
+                )
+            ), batch_size)
+            self.insert(FavoriteRecipe, (
+                FavoriteRecipe(user_id=user_id, recipe_id=recipe_id)
+                for user_id, recipe_id in pairs(
+                    generator, user_ids, recipe_ids, kwargs['favorites']
+                )
+            ), batch_size)
+            self.insert(ShoppingCart, (
+                ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+                for user_id, recipe_id in pairs(
+                    generator, user_ids, recipe_ids, kwargs['carts']
+                )
+            ), batch_size)
+            # bulk_create обходит save() и сигналы, производные данные
+            # пересчитываются целиком
+            call_command('reconcile_counters', stdout=self.stdout)
+            call_command(
+                'decay_recipe_scores', rebuild=True, stdout=self.stdout
+            )
+            call_command('rebuild_shopping_lists', stdout=self.stdout)
+            call_command('rebuild_feeds', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        call_command('rebuild_similar_recipes', stdout=self.stdout)
+        bump_version(RECIPES_NAMESPACE)
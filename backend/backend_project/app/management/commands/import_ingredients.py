@@ -1,36 +1,130 @@
 import csv
+import time
+from itertools import islice
 
 from django.core.management import BaseCommand
+from django.db import connection, transaction
 
+from api.catalog import INGREDIENTS_CATALOG, bump_catalog_version
 from app.models import Ingredient
 
+BATCH_SIZE = 1000
+COPY_TABLE = 'import_ingredients'
+PROGRESS = 'Processed {count} rows, {rate:.0f} rows/s'
+COPIED = 'Copied {count} rows in {elapsed:.1f} s, {rate:.0f} rows/s'
+INSERTED = 'Inserted {count} new ingredients in {elapsed:.1f} s'
+IMPORTED = (
+    'Imported {created} new ingredients from {path} in {elapsed:.1f} s'
+)
+
 
 def parse_csv(file_path):
-    data = []
     with open(
         file_path, newline='', encoding='utf-8'
     ) as f:
         for line in csv.reader(f):
-            data.append(line)
-    return data
+            yield line
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
 
 
-def import_ingredients(data):
-    ingredients = [
-        Ingredient(
-            name=line[0],
-            measurement_unit=line[1]
-        ) for line in data
-    ]
-    Ingredient.objects.bulk_create(ingredients)
+def import_ingredients(data, batch_size=BATCH_SIZE, report=None):
+    """
+    Импорт пачками по batch_size строк. Уже существующие пары
+    (название, единица измерения) пропускаются.
+    """
+    count = 0
+    start = time.monotonic()
+    for batch in batches(data, batch_size):
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(
+                    name=line[0],
+                    measurement_unit=line[1]
+                ) for line in batch
+            ],
+            ignore_conflicts=True
+        )
+        count += len(batch)
+        if report:
+            report(count, time.monotonic() - start)
+    # bulk_create не отправляет сигналы, версия справочника меняется явно
+    bump_catalog_version(INGREDIENTS_CATALOG)
+
+
+def copy_ingredients(file_path, report=None):
+    """
+    Импорт на PostgreSQL: COPY во временную таблицу и перенос новых пар
+    одним INSERT ... ON CONFLICT DO NOTHING. report(строки, время,
+    сообщение) вызывается после COPY и после INSERT.
+    """
+    table = Ingredient._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {COPY_TABLE} '
+            '(name varchar(200), measurement_unit varchar(200)) '
+            'ON COMMIT DROP'
+        )
+        start = time.monotonic()
+        with open(file_path, newline='', encoding='utf-8') as f:
+            cursor.copy_expert(
+                f'COPY {COPY_TABLE} FROM STDIN WITH (FORMAT csv)', f
+            )
+        copied = cursor.rowcount
+        if copied < 0:
+            # Старые версии psycopg2 не сообщают число строк COPY
+            cursor.execute(f'SELECT count(*) FROM {COPY_TABLE}')
+            copied = cursor.fetchone()[0]
+        if report:
+            report(copied, time.monotonic() - start, COPIED)
+        start = time.monotonic()
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            f'SELECT DISTINCT name, measurement_unit FROM {COPY_TABLE} '
+            'ON CONFLICT DO NOTHING'
+        )
+        if report:
+            report(cursor.rowcount, time.monotonic() - start, INSERTED)
+    bump_catalog_version(INGREDIENTS_CATALOG)
 
 
 class Command(BaseCommand):
-    """Менеджмент команда для импорта списка ингредиентов и не более"""
+    """
+    Менеджмент команда для импорта списка ингредиентов. Файл читается
+    потоково, повторный импорт не создает дубликатов.
+    """
 
     def add_arguments(self, parser):
         parser.add_argument('--path', type=str)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже на PostgreSQL'
+        )
+
+    def report(self, count, elapsed, message=PROGRESS):
+        self.stdout.write(message.format(
+            count=count, elapsed=elapsed,
+            rate=count / elapsed if elapsed else 0
+        ))
 
     def handle(self, *args, **kwargs):
         path = kwargs.get('path')
-        import_ingredients(parse_csv(path))
+        start = time.monotonic()
+        before = Ingredient.objects.count()
+        if connection.vendor == 'postgresql' and not kwargs['no_copy']:
+            copy_ingredients(path, self.report)
+        else:
+            import_ingredients(
+                parse_csv(path), kwargs['batch_size'], self.report
+            )
+        self.stdout.write(self.style.SUCCESS(IMPORTED.format(
+            created=Ingredient.objects.count() - before, path=path,
+            elapsed=time.monotonic() - start
+        )))
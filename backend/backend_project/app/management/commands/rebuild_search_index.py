@@ -0,0 +1,40 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from app.models import Recipe
+
+BATCH_SIZE = 1000
+REBUILT = 'Search index rebuilt for {count} recipes in {elapsed:.1f} s'
+
+
+def rebuild_search_index(batch_size=BATCH_SIZE):
+    """Пересчет поискового индекса всех рецептов пачками по ключу."""
+    recipes = Recipe.objects.only('id', 'name', 'text').order_by('pk')
+    count = last = 0
+    while True:
+        batch = list(recipes.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            return count
+        with transaction.atomic():
+            Recipe.update_search_index(batch)
+        count += len(batch)
+        last = batch[-1].pk
+
+
+class Command(BaseCommand):
+    """
+    Менеджмент команда для заполнения поискового индекса рецептов,
+    например после миграции или массовой загрузки без save().
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **kwargs):
+        start = time.monotonic()
+        count = rebuild_search_index(kwargs['batch_size'])
+        self.stdout.write(self.style.SUCCESS(REBUILT.format(
+            count=count, elapsed=time.monotonic() - start
+        )))
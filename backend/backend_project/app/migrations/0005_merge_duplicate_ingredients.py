@@ -0,0 +1,98 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+# Наибольшее значение PositiveSmallIntegerField на всех бэкендах
+MAX_AMOUNT = 32767
+
+
+def merge_rows(model, duplicate_id, kept_id):
+    """
+    Перенос состава рецептов с ингредиента duplicate_id на kept_id. Если в
+    рецепте уже есть kept_id, количества складываются, не превышая
+    MAX_AMOUNT, а строка дубликата удаляется.
+    """
+    kept = {
+        recipe_id: (pk, amount)
+        for pk, recipe_id, amount in model.objects.filter(
+            ingredient_id=kept_id
+        ).values_list('pk', 'recipe_id', 'amount')
+    }
+    for pk, recipe_id, amount in model.objects.filter(
+        ingredient_id=duplicate_id
+    ).values_list('pk', 'recipe_id', 'amount'):
+        if recipe_id in kept:
+            kept_pk, kept_amount = kept[recipe_id]
+            amount = min(amount + kept_amount, MAX_AMOUNT)
+            model.objects.filter(pk=kept_pk).update(amount=amount)
+            kept[recipe_id] = kept_pk, amount
+            model.objects.filter(pk=pk).delete()
+        else:
+            model.objects.filter(pk=pk).update(ingredient_id=kept_id)
+
+
+def rebuild_shopping_lists(RecipeIngredient, ShoppingListItem, ingredient_ids,
+                           kept_id):
+    """
+    Пересборка позиций списков покупок по kept_id из корзин. Простое
+    сложение позиций дубликатов разошлось бы с составом рецептов там, где
+    количество в рецепте урезано до MAX_AMOUNT.
+    """
+    ShoppingListItem.objects.filter(ingredient_id__in=ingredient_ids).delete()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=user_id, ingredient_id=kept_id, amount=amount)
+        for user_id, amount in RecipeIngredient.objects.filter(
+            ingredient_id=kept_id, recipe__shopping_recipe__isnull=False
+        ).values('recipe__shopping_recipe__user_id').annotate(
+            amount=Sum('amount')
+        ).values_list(
+            'recipe__shopping_recipe__user_id', 'amount'
+        ).order_by()
+    )
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """
+    Слияние ингредиентов с одинаковыми названием и единицей измерения
+    перед добавлением ограничения уникальности: остается ингредиент с
+    наименьшим id, ссылки рецептов переносятся на него, а списки покупок
+    по нему пересобираются из корзин.
+    """
+    Ingredient = apps.get_model('app', 'Ingredient')
+    RecipeIngredient = apps.get_model('app', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('app', 'ShoppingListItem')
+    groups = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        count=Count('pk'), kept_id=Min('pk')
+    ).filter(count__gt=1).order_by()
+    for group in groups:
+        duplicate_ids = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(pk=group['kept_id']).values_list('pk', flat=True))
+        for duplicate_id in duplicate_ids:
+            merge_rows(RecipeIngredient, duplicate_id, group['kept_id'])
+        rebuild_shopping_lists(
+            RecipeIngredient, ShoppingListItem,
+            [group['kept_id'], *duplicate_ids], group['kept_id']
+        )
+        Ingredient.objects.filter(pk__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient_name_unit'
+            ),
+        ),
+    ]
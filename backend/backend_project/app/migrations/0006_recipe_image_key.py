@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_merge_duplicate_ingredients'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_key',
+            field=models.CharField(blank=True, editable=False, max_length=32, verbose_name='Ключ уменьшенных копий изображения'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_score_decay'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipesnapshot',
+            name='version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Версия'),
+        ),
+        migrations.AlterField(
+            model_name='recipesnapshot',
+            name='data',
+            field=models.TextField(blank=True, verbose_name='JSON представления рецепта'),
+        ),
+    ]
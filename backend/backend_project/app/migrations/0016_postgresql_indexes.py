@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Индексы с методом GIN есть только на PostgreSQL, поэтому их нет в
+# Meta моделей: состояние миграций одинаково на всех базах
+INDEXES = (
+    (
+        'ingredient_name_trgm',
+        'CREATE INDEX IF NOT EXISTS ingredient_name_trgm ON app_ingredient'
+        ' USING gin (name gin_trgm_ops)',
+    ),
+    (
+        'recipe_search_vector',
+        'CREATE INDEX IF NOT EXISTS recipe_search_vector ON app_recipe'
+        ' USING gin (search_vector)',
+    ),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for _, sql in INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_recipesnapshot_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
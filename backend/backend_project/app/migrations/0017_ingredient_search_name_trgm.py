@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Поиск ингредиентов на PostgreSQL сравнивает название без учета регистра
+# и с «ё», замененной на «е», как индекс в памяти процесса. Триграммный
+# индекс строится по тому же выражению, что и условие поиска
+CREATE_INDEX = (
+    "CREATE INDEX IF NOT EXISTS ingredient_search_name_trgm"
+    " ON app_ingredient USING gin"
+    " ((replace(lower(name), 'ё', 'е')) gin_trgm_ops)"
+)
+DROP_INDEX = 'DROP INDEX IF EXISTS ingredient_search_name_trgm'
+CREATE_NAME_INDEX = (
+    'CREATE INDEX IF NOT EXISTS ingredient_name_trgm ON app_ingredient'
+    ' USING gin (name gin_trgm_ops)'
+)
+DROP_NAME_INDEX = 'DROP INDEX IF EXISTS ingredient_name_trgm'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_INDEX)
+    schema_editor.execute(DROP_NAME_INDEX)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_NAME_INDEX)
+    schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_postgresql_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,13 +1,39 @@
-from django.db import models
+import re
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import models
 from django.core.validators import MinValueValidator
 from django.db.models import UniqueConstraint
+from django.utils import timezone
 from django.utils.text import slugify
 from time import strftime
 from transliterate import translit
 
 User = get_user_model()
 
+USE_POSTGRESQL = settings.DATABASES['default']['ENGINE'].endswith(
+    'postgresql'
+)
+
+SEARCH_CONFIG = 'russian'
+SEARCH_TERM_LENGTH = 64
+SEARCH_TERM_PATTERN = re.compile(r'\w{2,}')
+SEARCH_VECTOR = (
+    SearchVector('name', weight='A', config=SEARCH_CONFIG)
+    + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+)
+
+
+def get_search_terms(text):
+    """Слова текста для поискового индекса без учета регистра и «ё»."""
+    return {
+        term[:SEARCH_TERM_LENGTH] for term in SEARCH_TERM_PATTERN.findall(
+            text.casefold().replace('ё', 'е')
+        )
+    }
+
 
 class Ingredient(models.Model):
     """Модель связи ингредиентов и единиц измерения"""
@@ -26,6 +52,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [UniqueConstraint(
+            fields=['name', 'measurement_unit'],
+            name='unique_ingredient_name_unit'
+        )]
+        # Триграммный индекс для поиска по подстроке создается миграцией
+        # 0017_ingredient_search_name_trgm только на PostgreSQL
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -62,6 +94,10 @@ class Tag(models.Model):
 class Recipe(models.Model):
     """Модель рецептов."""
 
+    COUNTER_FIELDS = ('favorites_count', 'shopping_carts_count')
+    SCORE_FIELDS = ('popular_score', 'trending_score')
+    SEARCH_FIELDS = ('name', 'text')
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -79,6 +115,12 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         verbose_name='Изображение'
     )
+    image_key = models.CharField(
+        max_length=32,
+        blank=True,
+        editable=False,
+        verbose_name='Ключ уменьшенных копий изображения'
+    )
     tag = models.ManyToManyField(
         Tag,
         related_name='recipes',
@@ -100,9 +142,50 @@ class Recipe(models.Model):
         unique=True,
         verbose_name='slug'
     )
+    favorites_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    shopping_carts_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзинах покупок'
+    )
+    popular_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Популярность'
+    )
+    trending_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Популярность за неделю'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
 
     class Meta:
         ordering = ['-pub_date']
+        # Полнотекстовый индекс создается миграцией 0016_postgresql_indexes
+        # только на PostgreSQL, на остальных базах поиск идет по таблице
+        # слов RecipeSearchTerm
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['-popular_score', '-pub_date', '-id'],
+                name='recipe_popular_idx'
+            ),
+            models.Index(
+                fields=['-trending_score', '-pub_date', '-id'],
+                name='recipe_trending_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -111,7 +194,37 @@ class Recipe(models.Model):
             f'{translit(self.name, "ru", reversed=True)[:136]}'
             f'{strftime("%Y%m%d%H%M%S")}'
         )
+        # Счетчики и оценки популярности меняются только выражениями F(),
+        # сохранение рецепта не должно затирать их устаревшими значениями.
+        if not self._state.adding and not kwargs.get('update_fields'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+                and field.name not in self.SCORE_FIELDS
+                and field.name != 'search_vector'
+            ]
         super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if not update_fields or set(update_fields) & set(self.SEARCH_FIELDS):
+            self.update_search_index([self])
+
+    @classmethod
+    def update_search_index(cls, recipes):
+        """
+        Пересчет поискового индекса рецептов: tsvector на PostgreSQL,
+        таблица слов на остальных базах.
+        """
+        if USE_POSTGRESQL:
+            cls.objects.filter(
+                pk__in=[recipe.pk for recipe in recipes]
+            ).update(search_vector=SEARCH_VECTOR)
+            return
+        RecipeSearchTerm.objects.filter(recipe__in=recipes).delete()
+        RecipeSearchTerm.objects.bulk_create([
+            term for recipe in recipes
+            for term in RecipeSearchTerm.for_recipe(recipe)
+        ])
 
     def __str__(self):
         return self.name
@@ -147,6 +260,13 @@ class RecipeIngredient(models.Model):
                 fields=['recipe', 'ingredient'], name='unique_piece'
             ),
         ]
+        # Поиск рецептов по набору ингредиентов идет от ингредиента
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='piece_ingredient_recipe_idx'
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -156,6 +276,135 @@ class RecipeIngredient(models.Model):
         )
 
 
+class ScoreDecay(models.Model):
+    """
+    Время последнего затухания оценок популярности рецептов. В таблице
+    одна строка.
+    """
+
+    decayed_at = models.DateTimeField(verbose_name='Время затухания')
+
+    class Meta:
+        verbose_name = 'Затухание оценок популярности'
+        verbose_name_plural = 'Затухания оценок популярности'
+
+    def __str__(self):
+        return f'Оценки популярности затухли к {self.decayed_at}'
+
+
+class RecipeSnapshot(models.Model):
+    """
+    Сериализованное представление рецепта без полей, зависящих от
+    пользователя. Пересобирается или сбрасывается в той же транзакции,
+    что и изменение рецепта, его тегов, ингредиентов или автора. Каждое
+    изменение увеличивает версию, пустые данные — сброшенный снимок.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='snapshot',
+        verbose_name='Рецепт'
+    )
+    data = models.TextField(
+        blank=True,
+        verbose_name='JSON представления рецепта'
+    )
+    version = models.PositiveIntegerField(default=0, verbose_name='Версия')
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Снимок рецепта'
+        verbose_name_plural = 'Снимки рецептов'
+
+    def __str__(self):
+        return f'Снимок рецепта "{self.recipe}"'
+
+
+class SimilarRecipe(models.Model):
+    """
+    Похожий рецепт по общим ингредиентам и тегам. Для каждого рецепта
+    хранятся SIMILAR_RECIPES_COUNT соседей с наибольшим сходством.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [UniqueConstraint(
+            fields=['recipe', 'similar'], name='unique_similar_recipe'
+        )]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'], name='similar_recipe_score_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'Рецепт "{self.similar}" похож на "{self.recipe}"'
+
+
+class RecipeSearchTerm(models.Model):
+    """
+    Слово из названия или описания рецепта. Упрощенный поисковый индекс
+    для баз без полнотекстового поиска.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='search_terms',
+        verbose_name='Рецепт',
+    )
+    term = models.CharField(
+        max_length=SEARCH_TERM_LENGTH,
+        verbose_name='Слово'
+    )
+    in_name = models.BooleanField(
+        default=False,
+        verbose_name='Входит в название'
+    )
+
+    class Meta:
+        verbose_name = 'Слово поискового индекса'
+        verbose_name_plural = 'Слова поискового индекса'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'term'], name='unique_recipe_search_term'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['term', 'recipe'], name='recipe_search_term_idx'
+            ),
+        ]
+
+    @classmethod
+    def for_recipe(cls, recipe):
+        name_terms = get_search_terms(recipe.name)
+        return [
+            cls(recipe=recipe, term=term, in_name=term in name_terms)
+            for term in name_terms | get_search_terms(recipe.text)
+        ]
+
+    def __str__(self):
+        return f'"{self.term}" в рецепте "{self.recipe}"'
+
+
 class RecipeTag(models.Model):
     """Модель связи рецептов с тегами."""
 
@@ -211,6 +460,56 @@ class Subscription(models.Model):
         )
 
 
+class FeedEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя. Записи создаются при публикации
+    рецепта для всех подписчиков автора, кроме очень популярных авторов,
+    чьи рецепты добавляются в ленту при чтении.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации рецепта')
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+        constraints = [UniqueConstraint(
+            fields=['user', 'recipe'], name='unique_feed_entry'
+        )]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='feed_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f'Рецепт "{self.recipe}" в ленте пользователя'
+            f' "{self.user.username}"'
+        )
+
+
 class FavoriteRecipe(models.Model):
     """Модель любимых рецептов"""
     recipe = models.ForeignKey(
@@ -226,6 +525,11 @@ class FavoriteRecipe(models.Model):
         related_name='favorite_user',
         on_delete=models.CASCADE,
     )
+    created = models.DateTimeField(
+        default=timezone.now,
+        editable=False,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         verbose_name = 'Любимый рецепт'
@@ -258,6 +562,11 @@ class ShoppingCart(models.Model):
         related_name='shopping_user',
         on_delete=models.CASCADE,
     )
+    created = models.DateTimeField(
+        default=timezone.now,
+        editable=False,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         verbose_name = 'Рецепт в корзине покупок'
@@ -272,3 +581,95 @@ class ShoppingCart(models.Model):
             f'Рецепт "{self.recipe.name}" в корзине у пользователя'
             f' "{self.user.username}"'
         )
+
+
+class ShoppingListItem(models.Model):
+    """
+    Итоговое количество ингредиента в списке покупок пользователя.
+
+    Поддерживается инкрементально при изменении корзины и рецептов,
+    чтобы выгрузка списка покупок была чтением по индексу.
+    """
+
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        related_name='shopping_list_items',
+        on_delete=models.CASCADE,
+    )
+    amount = models.IntegerField(default=0, verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        constraints = [UniqueConstraint(
+            fields=['user', 'ingredient'],
+            name='unique_user_shopping_list_ingredient'
+        )]
+
+    def __str__(self):
+        return (
+            f'{self.ingredient} в количестве {self.amount} в списке покупок'
+            f' пользователя "{self.user.username}"'
+        )
+
+
+class ShoppingListExport(models.Model):
+    """Задание на выгрузку списка покупок в файл."""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        related_name='shopping_list_exports',
+        on_delete=models.CASCADE,
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=STATUSES,
+        default=PENDING,
+        verbose_name='Статус'
+    )
+    digest = models.CharField(
+        max_length=64,
+        verbose_name='Хэш содержимого списка покупок'
+    )
+    file = models.FileField(
+        upload_to='shopping_lists/',
+        blank=True,
+        verbose_name='Файл'
+    )
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created']
+        indexes = [
+            models.Index(fields=['status', 'created']),
+            models.Index(fields=['user', 'digest']),
+        ]
+        verbose_name = 'Выгрузка списка покупок'
+        verbose_name_plural = 'Выгрузки списков покупок'
+
+    def __str__(self):
+        return (
+            f'Выгрузка {self.pk} пользователя "{self.user.username}":'
+            f' {self.status}'
+        )
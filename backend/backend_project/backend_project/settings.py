@@ -29,6 +29,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.RequestMetricsMiddleware',
+    'api.replicas.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,21 +70,83 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='p0$tGre$'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        # Постоянные соединения, проверка перед запросом в DB_HEALTH_CHECKS
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
     }
 }
 
+# Реплики для чтения: хосты через запятую, формат host или host:port.
+# Для локальной проверки можно указать хост основной базы.
+DATABASE_REPLICAS = []
+for number, address in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', default='').split(',')), 1
+):
+    host, _, port = address.strip().partition(':')
+    DATABASE_REPLICAS.append(f'replica_{number}')
+    DATABASES[f'replica_{number}'] = dict(
+        DATABASES['default'],
+        HOST=host,
+        PORT=port or DATABASES['default']['PORT'],
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+DB_HEALTH_CHECKS = os.getenv('DB_HEALTH_CHECKS', default='True') == 'True'
+# Не чаще чем раз в столько секунд соединение проверяется запросом
+DB_HEALTH_CHECK_INTERVAL = int(
+    os.getenv('DB_HEALTH_CHECK_INTERVAL', default=10)
+)
+# Сколько секунд после записи чтения пользователя идут в основную базу
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', default=5))
+
+# Общий для процессов gunicorn кэш: версии справочников, ответы, число
+# объектов в выборках, токены. Его потеря только сбрасывает закэшированное.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    default='django.core.cache.backends.memcached.MemcachedCache'
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', default='memcached:11211'),
+    }
+}
+if 'memcached' not in CACHE_BACKEND:
+    # DatabaseCache и LocMemCache по умолчанию хранят 300 ключей и при
+    # переполнении удаляют треть из них, включая версии справочников
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=100000)),
+        'CULL_FREQUENCY': int(os.getenv('CACHE_CULL_FREQUENCY', default=10)),
+    }
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'PAGE_SIZE': 6
 }
 
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', default=300))
+AUTH_TOKEN_LOCAL_TTL = int(os.getenv('AUTH_TOKEN_LOCAL_TTL', default=5))
+AUTH_TOKEN_LOCAL_CACHE_SIZE = 1024
+
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', default=100))
+BULK_RECIPES_MAX = 100
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', default=60)
+)
+RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_TIMEOUT', default=300)
+)
+RESPONSE_CACHE_STATS_INTERVAL = float(
+    os.getenv('RESPONSE_CACHE_STATS_INTERVAL', default=10)
+)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -115,3 +179,58 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'django_static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+IMAGE_RENDITION_WIDTHS = {'small': 300, 'medium': 600}
+IMAGE_RENDITION_QUALITY = 80
+IMAGE_PROCESSING_WORKERS = int(
+    os.getenv('IMAGE_PROCESSING_WORKERS', default=2)
+)
+
+EXPORT_JOB_TIMEOUT = int(os.getenv('EXPORT_JOB_TIMEOUT', default=300))
+
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', default=1000)
+)
+FEED_BACKFILL_SIZE = 100
+
+# Период полураспада оценок популярности рецептов в днях для сортировок
+# ordering=popular и ordering=trending
+POPULAR_HALF_LIFE_DAYS = float(
+    os.getenv('POPULAR_HALF_LIFE_DAYS', default=30)
+)
+TRENDING_HALF_LIFE_DAYS = float(
+    os.getenv('TRENDING_HALF_LIFE_DAYS', default=7)
+)
+
+# Число похожих рецептов, которое хранится для каждого рецепта
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', default=10))
+
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', default=20))
+
+CATALOG_VERSION_CHECK_INTERVAL = float(
+    os.getenv('CATALOG_VERSION_CHECK_INTERVAL', default=1)
+)
+CATALOG_CACHE_MAX_AGE = int(os.getenv('CATALOG_CACHE_MAX_AGE', default=0))
+
+REQUEST_METRICS_ENABLED = (
+    os.getenv('REQUEST_METRICS_ENABLED', default='False') == 'True'
+)
+REQUEST_METRICS_SLOW_REQUEST_MS = float(
+    os.getenv('REQUEST_METRICS_SLOW_REQUEST_MS', default=500)
+)
+REQUEST_METRICS_SLOW_SQL_MS = float(
+    os.getenv('REQUEST_METRICS_SLOW_SQL_MS', default=100)
+)
+REQUEST_METRICS_SLOW_QUERIES = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.metrics': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
@@ -0,0 +1,19 @@
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+# Тесты запускаются без PostgreSQL и общего кэша: тестовая база SQLite
+# создается в памяти
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'test.sqlite3'),
+    }
+}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
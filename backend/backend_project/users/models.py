@@ -6,6 +6,8 @@ from django.db import models
 class CustomUser(AbstractUser):
     """Кастомная модель пользователя"""
 
+    COUNTER_FIELDS = ('recipes_count', 'followers_count')
+
     email = models.EmailField(
         unique=True,
         max_length=254,
@@ -13,6 +15,16 @@ class CustomUser(AbstractUser):
         verbose_name='Адрес электронной почты'
     )
     first_name = models.CharField(max_length=150)
+    recipes_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов'
+    )
+    followers_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков'
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name', 'username', 'password']
@@ -21,6 +33,17 @@ class CustomUser(AbstractUser):
     def is_admin(self):
         return self.is_staff
 
+    def save(self, *args, **kwargs):
+        # Счетчики меняются только выражениями F(), сохранение пользователя
+        # не должно затирать их устаревшими значениями.
+        if not self._state.adding and not kwargs.get('update_fields'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['email']
         verbose_name = 'Пользователь'
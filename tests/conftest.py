@@ -0,0 +1,103 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from api.authentication import local_cache
+from api.catalog import CATALOGS
+from app.models import (
+    Ingredient, Recipe, RecipeIngredient, RecipeTag, Subscription, Tag
+)
+
+User = get_user_model()
+
+IMAGE = 'recipes/images/test.jpg'
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Хранилище LocMemCache, кэш токенов и справочники в памяти общие для
+    # всех тестов процесса
+    cache.clear()
+    local_cache.entries.clear()
+    for catalog in CATALOGS.values():
+        catalog.data = None
+        catalog.checked = 0
+
+
+def create_user(number):
+    return User.objects.create_user(
+        username=f'user{number}', email=f'user{number}@example.com',
+        first_name='Имя', last_name='Фамилия', password='password'
+    )
+
+
+@pytest.fixture
+def user(db):
+    return create_user(0)
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def make_user(db):
+    numbers = iter(range(1, 1000))
+    return lambda: create_user(next(numbers))
+
+
+@pytest.fixture
+def tags(db):
+    return [
+        Tag.objects.create(
+            name=f'Тег {number}', slug=f'tag{number}', color=f'#00000{number}'
+        )
+        for number in range(3)
+    ]
+
+
+@pytest.fixture
+def ingredients(db):
+    return [
+        Ingredient.objects.create(
+            name=f'Ингредиент {number}', measurement_unit='г'
+        )
+        for number in range(3)
+    ]
+
+
+@pytest.fixture
+def make_recipes(tags, ingredients):
+    """Создает count рецептов автора со всеми тегами и ингредиентами."""
+    numbers = iter(range(1000))
+
+    def make_recipes(author, count):
+        recipes = []
+        for _ in range(count):
+            number = next(numbers)
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                image=IMAGE, cooking_time=number + 1
+            )
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag=tag) for tag in tags
+            )
+            for amount, ingredient in enumerate(ingredients, 1):
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+            recipes.append(recipe)
+        return recipes
+
+    return make_recipes
+
+
+@pytest.fixture
+def subscribe(db):
+    return lambda user, author: Subscription.objects.create(
+        user=user, author=author
+    )
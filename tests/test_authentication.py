@@ -0,0 +1,55 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.authentication import (
+    CachedTokenAuthentication, get_cache_keys, local_cache
+)
+
+
+@pytest.fixture
+def token(user):
+    return Token.objects.create(user=user)
+
+
+def authenticate(token):
+    return CachedTokenAuthentication().authenticate_credentials(token.key)
+
+
+def count_token_queries(user, **kwargs):
+    with CaptureQueriesContext(connection) as captured:
+        user.save(**kwargs)
+    return sum('authtoken_token' in query['sql'] for query in captured)
+
+
+def test_local_cache_returns_copies(token):
+    user, _ = authenticate(token)
+    user.first_name = 'Изменено'
+    cached, _ = authenticate(token)
+    assert cached.first_name == 'Имя'
+    assert cached is not user
+
+
+@pytest.mark.django_db(transaction=True)
+def test_stale_shared_entry_rejected(token):
+    cache_key, _ = get_cache_keys(token.key)
+    authenticate(token)
+    stale = cache.get(cache_key)
+    token.user.is_active = False
+    token.user.save()
+    # Запрос, прочитавший БД до сброса, кладет старые данные после него
+    cache.set(cache_key, stale)
+    local_cache.entries.clear()
+    with pytest.raises(AuthenticationFailed):
+        authenticate(token)
+
+
+def test_tokens_reset_only_for_auth_fields(user, token):
+    assert count_token_queries(user, update_fields=['last_login']) == 0
+    user.first_name = 'Другое'
+    assert count_token_queries(user) == 0
+    user.set_password('other-password')
+    assert count_token_queries(user) == 1
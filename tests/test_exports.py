@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+from api.exports import claim_export, heartbeat, run_export, start_export
+from app.models import ShoppingListExport
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+
+def test_start_export_reuses_job(user):
+    assert start_export(user) == start_export(user)
+
+
+def test_successful_retry_clears_error(user):
+    ShoppingListExport.objects.create(
+        user=user, digest='', status=ShoppingListExport.RUNNING,
+        error='Прошлая попытка'
+    )
+    run_export(ShoppingListExport.objects.get())
+    export = ShoppingListExport.objects.get()
+    assert (export.status, export.error) == (ShoppingListExport.DONE, '')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_running_job_is_not_reclaimed(user, settings):
+    settings.EXPORT_JOB_TIMEOUT = 0.3
+    start_export(user)
+    export = claim_export()
+    with heartbeat(export):
+        time.sleep(0.5)
+        assert claim_export() is None
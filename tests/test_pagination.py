@@ -0,0 +1,49 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from app.models import FavoriteRecipe
+
+
+def get_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def get_counted(client, url):
+    """Ответ на GET url и число запросов COUNT при нем."""
+    with CaptureQueriesContext(connection) as captured:
+        response = client.get(url)
+    assert response.status_code == 200, response.content
+    return response.json(), sum(
+        'COUNT(' in query['sql'].upper() for query in captured
+    )
+
+
+def test_recipe_count_shared_by_users(user_client, make_user, make_recipes):
+    make_recipes(make_user(), 3)
+    user_client.get('/api/recipes/')
+    data, counts = get_counted(get_client(make_user()), '/api/recipes/')
+    assert (data['count'], counts) == (3, 0)
+
+
+def test_user_filter_count_is_exact(user, user_client, make_user,
+                                    make_recipes):
+    recipes = make_recipes(make_user(), 3)
+    FavoriteRecipe.objects.create(user=user, recipe=recipes[0])
+    user_client.get('/api/recipes/?is_favorited=1')
+    data, counts = get_counted(
+        get_client(make_user()), '/api/recipes/?is_favorited=1'
+    )
+    assert (data['count'], counts) == (0, 1)
+
+
+def test_cursor_page_skips_count(user_client, make_user, make_recipes):
+    make_recipes(make_user(), 3)
+    data, counts = get_counted(user_client, '/api/recipes/?cursor=&limit=2')
+    assert (data['count'], len(data['results']), counts) == (None, 2, 0)
+    data, counts = get_counted(
+        user_client, '/api/recipes/?cursor=&limit=2&count=1'
+    )
+    assert (data['count'], counts) == (3, 1)
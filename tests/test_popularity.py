@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from api.popularity import decay_scores, rebuild_scores, set_decayed_at
+from app.models import FavoriteRecipe, Recipe
+
+HOUR = timedelta(hours=1)
+
+
+def get_scores(recipe):
+    return Recipe.objects.filter(pk=recipe.pk).values_list(
+        *Recipe.SCORE_FIELDS
+    ).get()
+
+
+def test_removal_subtracts_stored_contribution(user, make_user,
+                                               make_recipes):
+    recipe, = make_recipes(make_user(), 1)
+    now = timezone.now()
+    set_decayed_at(now - 3 * HOUR)
+    first = FavoriteRecipe.objects.create(user=user, recipe=recipe)
+    decay_scores((4 * HOUR).total_seconds())
+    set_decayed_at(now + HOUR)
+    # Вторая запись добавлена до последнего затухания, первая — между
+    # прошлым и последним
+    FavoriteRecipe.objects.create(user=make_user(), recipe=recipe)
+    first.delete()
+    scores = get_scores(recipe)
+    rebuild_scores(now + HOUR)
+    assert scores == pytest.approx(get_scores(recipe), rel=1e-3)
@@ -0,0 +1,67 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from app.models import FavoriteRecipe, ShoppingCart
+from utils import count_queries
+
+# Бюджеты запросов к БД: не зависят от числа рецептов, тегов и
+# ингредиентов на странице
+RECIPE_LIST_QUERIES = 3
+ANONYMOUS_RECIPE_LIST_QUERIES = 3
+RECIPE_DETAIL_QUERIES = 2
+
+
+@pytest.mark.parametrize('count', [1, 6])
+def test_recipe_list_queries(user_client, make_user, make_recipes, count):
+    make_recipes(make_user(), count)
+    assert count_queries(
+        user_client, '/api/recipes/?limit=6'
+    ) == RECIPE_LIST_QUERIES
+
+
+@pytest.mark.parametrize('count', [1, 6])
+def test_anonymous_recipe_list_queries(client, make_user, make_recipes,
+                                       count):
+    make_recipes(make_user(), count)
+    assert count_queries(
+        client, '/api/recipes/?limit=6'
+    ) == ANONYMOUS_RECIPE_LIST_QUERIES
+
+
+def test_anonymous_recipe_list_cached(client, make_user, make_recipes):
+    make_recipes(make_user(), 2)
+    client.get('/api/recipes/')
+    with CaptureQueriesContext(connection) as captured:
+        response = client.get('/api/recipes/')
+    assert response['X-Cache'] == 'hit'
+    assert len(captured) == 0
+
+
+def test_recipe_detail_queries(user_client, make_user, make_recipes):
+    recipe, = make_recipes(make_user(), 1)
+    assert count_queries(
+        user_client, f'/api/recipes/{recipe.pk}/'
+    ) == RECIPE_DETAIL_QUERIES
+
+
+def test_recipe_list_flags(user, user_client, make_user, make_recipes):
+    recipes = make_recipes(make_user(), 2)
+    FavoriteRecipe.objects.create(user=user, recipe=recipes[1])
+    ShoppingCart.objects.create(user=user, recipe=recipes[0])
+    response = user_client.get('/api/recipes/')
+    flags = {
+        item['id']: (item['is_favorited'], item['is_in_shopping_cart'])
+        for item in response.json()['results']
+    }
+    assert flags == {
+        recipes[0].pk: (False, True), recipes[1].pk: (True, False)
+    }
+
+
+def test_anonymous_recipe_list_flags(client, make_user, make_recipes):
+    make_recipes(make_user(), 1)
+    item, = client.get('/api/recipes/').json()['results']
+    assert (item['is_favorited'], item['is_in_shopping_cart']) == (
+        False, False
+    )
@@ -0,0 +1,30 @@
+import pytest
+from django.db import connection
+
+from api.replicas import close_unusable_connections
+
+
+@pytest.fixture
+def checks(db, monkeypatch):
+    """Число проверок соединения запросом к БД."""
+    calls = []
+    monkeypatch.setattr(
+        connection, 'is_usable', lambda: calls.append(True) or True
+    )
+    monkeypatch.delattr(connection, 'health_checked', raising=False)
+    connection.ensure_connection()
+    return calls
+
+
+def test_health_check_is_rate_limited(checks, settings):
+    settings.DB_HEALTH_CHECK_INTERVAL = 60
+    for _ in range(3):
+        close_unusable_connections()
+    assert len(checks) == 0
+
+
+def test_health_check_after_interval(checks, settings):
+    settings.DB_HEALTH_CHECK_INTERVAL = 0
+    for _ in range(3):
+        close_unusable_connections()
+    assert len(checks) == 2
@@ -0,0 +1,74 @@
+import pytest
+from rest_framework.test import APIClient
+
+from api.utils import get_shopping_list
+from app.models import ShoppingCart
+from utils import count_queries
+
+# Бюджет запросов к БД: не зависит от числа рецептов в корзине и их
+# ингредиентов
+SHOPPING_CART_QUERIES = 1
+
+
+def get_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def add_to_cart(user, recipes):
+    client = get_client(user)
+    for recipe in recipes:
+        response = client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        assert response.status_code == 201, response.content
+
+
+@pytest.mark.parametrize('count', [0, 1, 5])
+def test_download_shopping_cart_queries(user, user_client, make_user,
+                                        make_recipes, count):
+    author = make_user()
+    add_to_cart(user, make_recipes(author, count))
+    # Корзины других пользователей не влияют на число запросов
+    add_to_cart(make_user(), make_recipes(author, 3))
+    assert count_queries(
+        user_client, '/api/recipes/download_shopping_cart/'
+    ) == SHOPPING_CART_QUERIES
+
+
+def test_shopping_list_totals(user, make_user, make_recipes, ingredients):
+    author = make_user()
+    add_to_cart(user, make_recipes(author, 2))
+    add_to_cart(make_user(), make_recipes(author, 1))
+    assert list(get_shopping_list(user)) == [
+        (ingredient.name, ingredient.measurement_unit, 2 * amount)
+        for amount, ingredient in enumerate(ingredients, 1)
+    ]
+
+
+def test_shopping_list_follows_cart(user, make_user, make_recipes,
+                                    ingredients):
+    recipes = make_recipes(make_user(), 2)
+    add_to_cart(user, recipes)
+    response = get_client(user).delete(
+        f'/api/recipes/{recipes[0].pk}/shopping_cart/'
+    )
+    assert response.status_code == 204
+    assert list(get_shopping_list(user)) == [
+        (ingredient.name, ingredient.measurement_unit, amount)
+        for amount, ingredient in enumerate(ingredients, 1)
+    ]
+
+
+def test_shopping_list_follows_models(user, make_user, make_recipes,
+                                      ingredients):
+    # Изменения в обход API, например из админки или каскадом
+    recipes = make_recipes(make_user(), 2)
+    for recipe in recipes:
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+    recipes[0].delete()
+    recipes[1].pieces.filter(ingredient=ingredients[0]).delete()
+    assert list(get_shopping_list(user)) == [
+        (ingredient.name, ingredient.measurement_unit, amount)
+        for amount, ingredient in enumerate(ingredients, 1)
+        if ingredient != ingredients[0]
+    ]
@@ -0,0 +1,25 @@
+from api.similarity import rebuild_similar_recipes, update_similar_recipes
+from app.models import Ingredient, RecipeIngredient, SimilarRecipe
+
+
+def get_neighbors():
+    return sorted(SimilarRecipe.objects.values_list(
+        'recipe_id', 'similar_id'
+    ))
+
+
+def test_update_keeps_neighbor_lists_full(make_user, make_recipes):
+    recipes = make_recipes(make_user(), 5)
+    extra = Ingredient.objects.create(name='Редкий', measurement_unit='г')
+    for recipe in recipes[:3]:
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=extra, amount=1
+        )
+    rebuild_similar_recipes(count=2)
+    # Первый рецепт теряет общий ингредиент и уступает место в списках
+    # соседей рецепту, который раньше в них не попал
+    RecipeIngredient.objects.filter(recipe=recipes[0]).delete()
+    update_similar_recipes(recipes[0].pk, count=2)
+    updated = get_neighbors()
+    rebuild_similar_recipes(count=2)
+    assert updated == get_neighbors()
@@ -0,0 +1,30 @@
+import pytest
+
+from utils import count_queries
+
+# Бюджет запросов к БД: не зависит от числа авторов на странице и их
+# рецептов
+SUBSCRIPTIONS_QUERIES = 3
+
+
+@pytest.mark.parametrize('authors', [1, 6])
+def test_subscriptions_queries(user, user_client, make_user, make_recipes,
+                               subscribe, authors):
+    for number in range(authors):
+        author = make_user()
+        subscribe(user, author)
+        make_recipes(author, number + 1)
+    assert count_queries(
+        user_client, '/api/users/subscriptions/?recipes_limit=3'
+    ) == SUBSCRIPTIONS_QUERIES
+
+
+def test_subscriptions_recipes_limit(user, user_client, make_user,
+                                     make_recipes, subscribe):
+    author = make_user()
+    subscribe(user, author)
+    make_recipes(author, 5)
+    response = user_client.get('/api/users/subscriptions/?recipes_limit=3')
+    result, = response.json()['results']
+    assert len(result['recipes']) == 3
+    assert result['recipes_count'] == 5
@@ -0,0 +1,17 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def count_queries(client, url):
+    """
+    Число запросов к БД при GET url. Предварительный запрос прогревает
+    данные, которые достраиваются при чтении; кэш перед замером
+    очищается, чтобы ответ не пришел из него.
+    """
+    client.get(url)
+    cache.clear()
+    with CaptureQueriesContext(connection) as captured:
+        response = client.get(url)
+    assert response.status_code == 200, response.content
+    return len(captured)